@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+###
+# Benchmark
+# =========
+# Runs whole transfers between a receiver and a sender process over loopback, once without FEC
+# and once with it, and compares how long the sender takes to complete (setup, data and close).
+###
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import filecmp
+from src.helpers.arg_parser import ArgParser
+
+NUM_ARGS = 7  # Number of command-line arguments
+RECEIVER_STARTUP = 0.5 # Seconds to let the receiver bind its socket before the sender starts
+
+def run_transfer(args: list[str], sender_options: list[str]) -> float:
+    '''
+        Run one transfer and check the received file is identical to the one sent.
+
+        Args:
+            args            (list[str]): sender_port rcvr_port txt_file_to_send max_win rto flp rlp
+            sender_options  (list[str]): extra "--name=value" options for the sender
+        Returns:
+            float: seconds the sender took to complete
+    '''
+    sender_port, rcvr_port, txt_file_to_send, max_win = args[:4]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        txt_file_received = os.path.join(tmp_dir, 'received.txt')
+        receiver = subprocess.Popen([sys.executable, '-m', 'src.receiver.receiver',
+                                     rcvr_port, sender_port, txt_file_received, max_win],
+                                    stdout=subprocess.DEVNULL)
+        time.sleep(RECEIVER_STARTUP)
+
+        start = time.time()
+        subprocess.run([sys.executable, '-m', 'src.sender.sender'] + args + sender_options,
+                       stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.time() - start
+
+        # The receiver exits on its own 2 MSL after the FIN
+        receiver.wait()
+        if not filecmp.cmp(txt_file_to_send, txt_file_received, shallow=False):
+            sys.exit(f"Received file differs from {txt_file_to_send}")
+
+    return elapsed
+
+if __name__ == "__main__":
+    if len(sys.argv) < NUM_ARGS + 1:
+        sys.exit(f"Usage: {sys.argv[0]} sender_port rcvr_port txt_file_to_send max_win rto flp rlp [--fec=segments|auto] [--runs=count] [--mss=bytes]")
+
+    # Validate the arguments the same way the sender does, but pass them on as they are
+    ArgParser.parse_port(sys.argv[1])
+    ArgParser.parse_port(sys.argv[2])
+    ArgParser.parse_file_name(sys.argv[3])
+    ArgParser.parse_max_win(sys.argv[4])
+    ArgParser.parse_rto(sys.argv[5])
+    ArgParser.parse_prop(sys.argv[6])
+    ArgParser.parse_prop(sys.argv[7])
+    args = sys.argv[1:NUM_ARGS + 1]
+
+    options = ArgParser.parse_options(sys.argv[NUM_ARGS + 1:], ('fec', 'runs', 'mss'))
+    fec = options.get('fec', 'auto')
+    ArgParser.parse_fec(fec)
+    runs = int(options.get('runs', 3))
+    base_options = [f"--mss={ArgParser.parse_mss(options['mss'])}"] if 'mss' in options else []
+
+    for name, sender_options in (('without FEC', base_options), (f'with FEC ({fec})', base_options + [f'--fec={fec}'])):
+        times = [run_transfer(args, sender_options) for _ in range(runs)]
+        print(f"{name:<20} mean {sum(times) / runs:7.2f}s  min {min(times):7.2f}s  max {max(times):7.2f}s  ({runs} runs)")
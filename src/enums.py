@@ -11,10 +11,43 @@ class LogActions(Enum):
 
 class SegmentType(Enum):
 	'''
-		Enums for segment types, either DATA, ACK, SYN, or FIN. 
+		Enums for segment types, either DATA, ACK, SYN, FIN, FEC (parity), or DATA_ACK
+		(data carrying an ACK for the other direction, in duplex mode). 
 	'''
 	DATA = 0
 	ACK  = 1
 	SYN  = 2
 	FIN  = 3
+	FEC  = 4
+	DATA_ACK = 5
+
+class InsertStatus(Enum):
+	'''
+		Enums for the outcome of placing a DATA segment into the receiver's reassembly window.
+	'''
+	IN_ORDER      = 0
+	BUFFERED      = 1
+	DUPLICATE     = 2
+	OUT_OF_WINDOW = 3
+
+class FsyncPolicy(Enum):
+	'''
+		Enums for when the receiver fsyncs its output file: never (leave it to the OS),
+		once when the transfer is closed, or after every coalesced write.
+	'''
+	NONE  = 'none'
+	CLOSE = 'close'
+	BATCH = 'batch'
+
+class SynOption(Enum):
+	'''
+		Enums for the kinds of option carried by SYN and ACK segments.
+	'''
+	MSS    = 1
+	FEC    = 2
+	RESUME = 3
+	DUPLEX = 4
+	FAST_OPEN = 5
+	DELTA  = 6
+	RECEIVED = 7
 
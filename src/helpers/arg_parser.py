@@ -1,4 +1,9 @@
 import sys
+from src.enums import FsyncPolicy
+from src.helpers.stp_helpers import MAX_MSS
+from src.helpers.fec import MAX_FEC_GROUP
+
+MAX_SEQNO = 2**16 # Maximum sequence number
 
 class ArgParser:
     @staticmethod
@@ -52,7 +57,10 @@ class ArgParser:
     def parse_max_win(max_win_str):
         """Parse the max_win argument from the command-line.
 
-        This function needs to check whether max_win size >= 1000 and max_win is a multiple of 1000 bytes.
+        This function needs to check whether max_win size is positive. max_win also must not exceed
+        a third of the sequence space, otherwise the receiver cannot tell an old segment from a new one
+        by comparing sequence numbers: once segments are reordered, a delayed duplicate can trail
+        the next expected seqno by up to two windows.
 
         Args:
             max_win_str (str): The max_win argument from the command-line.
@@ -61,11 +69,51 @@ class ArgParser:
             int: max_win
         """
         max_win = int(max_win_str)
-        if max_win < 1000 or max_win % 1000 != 0:
-            sys.exit(f"Invalid max_win, must be greater than or equal to 1000 and be a multiple of 1000 bytes: {max_win}")
+        if max_win <= 0:
+            sys.exit(f"Invalid max_win, must be greater than 0: {max_win}")
+        if max_win > MAX_SEQNO // 3:
+            sys.exit(f"Invalid max_win, must be less than or equal to {MAX_SEQNO // 3} bytes: {max_win}")
 
         return max_win
 
+    @staticmethod
+    def parse_mss(mss_str):
+        """Parse the --mss option from the command-line.
+
+        This function needs to check whether 0 < mss <= MAX_MSS.
+
+        Args:
+            mss_str (str): The maximum segment size in bytes.
+
+        Returns:
+            int: mss
+        """
+        mss = int(mss_str)
+        if not (0 < mss <= MAX_MSS):
+            sys.exit(f"Invalid mss, must be between 1 and {MAX_MSS} bytes: {mss}")
+        return mss
+
+    @staticmethod
+    def parse_fec(fec_str):
+        """Parse the --fec option from the command-line.
+
+        This function needs to check whether the group size is between 1 and MAX_FEC_GROUP,
+        or "auto" to follow the observed loss rate.
+
+        Args:
+            fec_str (str): The number of data segments per parity segment, or "auto".
+
+        Returns:
+            int: group size (the starting one with "auto")
+            bool: whether the group size adapts to the loss rate
+        """
+        if fec_str == 'auto':
+            return MAX_FEC_GROUP, True
+        group = int(fec_str)
+        if not (1 <= group <= MAX_FEC_GROUP):
+            sys.exit(f"Invalid fec, must be auto or between 1 and {MAX_FEC_GROUP} segments: {group}")
+        return group, False
+
     @staticmethod
     def parse_rto(rto_str):
         """Parse the rto argument from the command-line.
@@ -83,6 +131,23 @@ class ArgParser:
             sys.exit(f"Invalid rto, must be an unsigned integer: {rto}")
         return rto
 
+    @staticmethod
+    def parse_delay(delay_str):
+        """Parse a delay argument of the simulator from the command-line.
+
+        This function needs to check whether delay >= 0.
+
+        Args:
+            delay_str (str): the delay in milliseconds.
+
+        Returns:
+            float: delay in milliseconds
+        """
+        delay = float(delay_str)
+        if delay < 0:
+            sys.exit(f"Invalid delay, must not be negative: {delay_str}")
+        return delay
+
     @staticmethod
     def parse_prop(prop_str):
         """Parse the flp/rlp argument from the command-line.
@@ -98,4 +163,57 @@ class ArgParser:
         prop = float(prop_str)
         if not (0.0 <= prop <= 1.0):
             sys.exit(f'Invalid flp/rlp, must be between 0 and 1 (inclusive): {prop_str}')
-        return prop
\ No newline at end of file
+        return prop
+
+    @staticmethod
+    def parse_options(option_strs, allowed):
+        """Parse the optional "--name=value" arguments that follow the positional ones.
+
+        A bare "--name" is taken as "--name=true". The program will terminate with an
+        error message on a malformed or unknown option.
+
+        Args:
+            option_strs (list[str]): The remaining command-line arguments.
+            allowed (tuple[str]): Names of the options this program accepts.
+
+        Returns:
+            dict[str, str]: option name to its (unparsed) value
+        """
+        options = {}
+        for option_str in option_strs:
+            if not option_str.startswith('--'):
+                sys.exit(f"Invalid option, must look like --name=value: {option_str}")
+            name, _, value = option_str[2:].partition('=')
+            if name not in allowed:
+                sys.exit(f"Unknown option --{name}, must be one of: {', '.join(allowed)}")
+            options[name] = value if value else 'true'
+        return options
+
+    @staticmethod
+    def parse_fsync(fsync_str):
+        """Parse the --fsync option from the command-line.
+
+        Args:
+            fsync_str (str): The --fsync option, either none, close or batch.
+
+        Returns:
+            FsyncPolicy: fsync policy
+        """
+        try:
+            return FsyncPolicy(fsync_str)
+        except ValueError:
+            sys.exit(f"Invalid fsync policy, must be one of {', '.join(p.value for p in FsyncPolicy)}: {fsync_str}")
+
+    @staticmethod
+    def parse_flag(flag_str):
+        """Parse an option that is either on or off, e.g. "--resume" or "--resume=false".
+
+        Args:
+            flag_str (str): The option value, either true or false.
+
+        Returns:
+            bool: whether the option is on
+        """
+        if flag_str not in ('true', 'false'):
+            sys.exit(f"Invalid flag, must be true or false: {flag_str}")
+        return flag_str == 'true'
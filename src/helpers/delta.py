@@ -0,0 +1,252 @@
+import hashlib
+import itertools
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional: without it the sender rolls the checksum one byte at a time in pure
+    # Python, which finds the same matches, only slower
+    np = None
+
+MIN_BLOCK_SIZE = 700        # Smallest block, smaller ones cost more in signatures than they save
+MAX_BLOCK_SIZE = 2**17      # Largest block
+WEAK_SIZE      = 4          # Size of the rolling checksum of a block
+STRONG_SIZE    = 16         # Size of the strong hash of a block
+SIGNATURE_SIZE = WEAK_SIZE + STRONG_SIZE
+SCAN_CHUNK     = 2**20      # Offsets whose rolling checksums are computed at once, bounds memory
+READ_CHUNK     = 2**20      # Bytes of the old file a copy instruction reads at once
+DELTA_SUFFIX   = '.delta'   # The receiver writes the new "received.txt" as "received.txt.delta" first
+COPY    = 1     # Kind of a copy instruction
+LITERAL = 2     # Kind of a literal instruction
+
+# Delta mode, after rsync. The receiver already has an earlier copy of the file. It cuts it into
+# blocks of block_size bytes and sends a signature of every whole block:
+#  +------+------+------+------+------+------+
+#  |   weak (4 bytes)          | strong (16) |
+#  +------+------+------+------+------+------+
+# The weak checksum of the bytes x_0 .. x_(L-1) is a | b << 16 with a = sum(x_i) and
+# b = sum((L - i) * x_i), both mod 2^16. It rolls: sliding one byte along the file takes a
+# constant number of operations, so the sender can look for a block at every offset of the new
+# file. Only when the weak checksum matches is the strong hash (blake2b) of that offset computed.
+#
+# The sender then sends the new file as a stream of instructions instead of the file itself:
+#  COPY:    | 1 |  index (4)  |  count (4)  |   "count" blocks of the old file from block "index"
+#  LITERAL: | 2 | length (4)  |  data (length) ...
+class Delta:
+    @staticmethod
+    def block_size_for(file_size: int) -> int:
+        '''
+            The square root of the file size balances the size of the signatures against how
+            much of a changed block has to be sent again, as rsync does.
+        '''
+        return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, math.isqrt(file_size)))
+
+    @staticmethod
+    def strong_hash(block: bytes) -> bytes:
+        return hashlib.blake2b(block, digest_size=STRONG_SIZE).digest()
+
+    @staticmethod
+    def weak_checksum(block: bytes) -> int:
+        # The running sums of the block add up to sum((L - i) * x_i), and both sums run in C
+        return (sum(block) & 0xFFFF) | (sum(itertools.accumulate(block)) & 0xFFFF) << 16
+
+    @staticmethod
+    def create_signatures(file_name: str, block_size: int) -> bytes:
+        '''
+            Args:
+                file_name   (str): the earlier copy of the file
+                block_size  (int): size of a block
+            Returns:
+                bytes: signature of every whole block of the file, in order
+        '''
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        signatures = []
+        for start in range(0, len(data) - block_size + 1, block_size):
+            block = data[start:start + block_size]
+            signatures.append(Delta.weak_checksum(block).to_bytes(WEAK_SIZE, byteorder="big") + Delta.strong_hash(block))
+        return b''.join(signatures)
+
+    @staticmethod
+    def create_delta(data: bytes, signatures: bytes, block_size: int) -> bytes:
+        '''
+            Args:
+                data        (bytes): the new file
+                signatures  (bytes): signatures of the receiver's copy, from create_signatures()
+                block_size  (int): size of a block
+            Returns:
+                bytes: the instructions that rebuild data from the receiver's copy
+        '''
+        # weak checksum -> strong hash -> index of the first block with them
+        table: dict[int, dict[bytes, int]] = {}
+        for index in range(len(signatures) // SIGNATURE_SIZE):
+            signature = signatures[index * SIGNATURE_SIZE:(index + 1) * SIGNATURE_SIZE]
+            table.setdefault(int.from_bytes(signature[:WEAK_SIZE], 'big'), {}).setdefault(signature[WEAK_SIZE:], index)
+
+        instructions = []
+        literal_start = 0
+        copy_index, copy_count = 0, 0  # Run of consecutive blocks not written out yet
+        find_matches = Delta.find_matches_vectorized if np is not None else Delta.find_matches
+        for offset, index in find_matches(data, table, block_size):
+            if offset == literal_start and copy_count and index == copy_index + copy_count:
+                copy_count += 1
+            else:
+                if copy_count:
+                    instructions.append(bytes([COPY]) + copy_index.to_bytes(4, byteorder="big") + copy_count.to_bytes(4, byteorder="big"))
+                if offset > literal_start:
+                    instructions.append(bytes([LITERAL]) + (offset - literal_start).to_bytes(4, byteorder="big") + data[literal_start:offset])
+                copy_index, copy_count = index, 1
+            literal_start = offset + block_size
+
+        if copy_count:
+            instructions.append(bytes([COPY]) + copy_index.to_bytes(4, byteorder="big") + copy_count.to_bytes(4, byteorder="big"))
+        if len(data) > literal_start:
+            instructions.append(bytes([LITERAL]) + (len(data) - literal_start).to_bytes(4, byteorder="big") + data[literal_start:])
+        return b''.join(instructions)
+
+    @staticmethod
+    def find_matches(data: bytes, table: dict, block_size: int):
+        '''
+            Roll the weak checksum along data one byte at a time, in pure Python.
+
+            Args:
+                data        (bytes): the new file
+                table       (dict): weak checksum -> strong hash -> block index
+                block_size  (int): size of a block
+            Yields:
+                int: offset in data of a block the receiver has, never overlapping the previous one
+                int: index of that block
+        '''
+        last = len(data) - block_size
+        offset = 0
+        is_fresh = True
+        while offset <= last:
+            if is_fresh:
+                block = data[offset:offset + block_size]
+                a, b = sum(block) & 0xFFFF, sum(itertools.accumulate(block)) & 0xFFFF
+                is_fresh = False
+
+            strong_hashes = table.get(a | b << 16)
+            if strong_hashes:
+                index = strong_hashes.get(Delta.strong_hash(data[offset:offset + block_size]))
+                if index is not None:
+                    yield offset, index
+                    # Carry on after the block, with a checksum computed from scratch
+                    offset += block_size
+                    is_fresh = True
+                    continue
+
+            if offset == last: break
+            old = data[offset]
+            a = (a - old + data[offset + block_size]) & 0xFFFF
+            b = (b - block_size * old + a) & 0xFFFF
+            offset += 1
+
+    @staticmethod
+    def rolling_checksums(data: bytes, block_size: int, start: int, count: int):
+        '''
+            Weak checksums of the blocks starting at every offset from start to start + count - 1,
+            computed at once with numpy from prefix sums. The arithmetic is on uint32, whose
+            wraparound leaves the sums right mod 2^16.
+
+            Returns:
+                numpy array of uint32
+        '''
+        x = np.frombuffer(data, dtype=np.uint8, count=count + block_size - 1, offset=start).astype(np.uint32)
+        k = np.arange(len(x), dtype=np.uint32)
+        # sums[i] = x_0 + .. + x_(i-1), and weighted[i] the same with x_j weighted by j
+        sums = np.zeros(len(x) + 1, dtype=np.uint32)
+        np.cumsum(x, dtype=np.uint32, out=sums[1:])
+        weighted = np.zeros(len(x) + 1, dtype=np.uint32)
+        np.cumsum(x * k, dtype=np.uint32, out=weighted[1:])
+
+        # For the block at k: a = sum(x_j), b = sum((L + k - j) * x_j) = (L + k) * a - sum(j * x_j)
+        a = sums[block_size:] - sums[:-block_size]
+        b = (k[:count] + block_size) * a - (weighted[block_size:] - weighted[:-block_size])
+        return (a & 0xFFFF) | ((b & 0xFFFF) << 16)
+
+    @staticmethod
+    def find_matches_vectorized(data: bytes, table: dict, block_size: int):
+        '''
+            Same as find_matches(), but the weak checksums of a whole chunk of offsets are computed
+            at once, and only the offsets whose weak checksum is in the table are looked at.
+        '''
+        weak_checksums = np.fromiter(table.keys(), dtype=np.uint32, count=len(table))
+        last = len(data) - block_size
+        offset = 0
+        while offset <= last:
+            chunk_start = offset
+            count = min(SCAN_CHUNK, last + 1 - chunk_start)
+            weaks = Delta.rolling_checksums(data, block_size, chunk_start, count)
+            candidates = np.flatnonzero(np.isin(weaks, weak_checksums))
+
+            i = 0
+            while i < len(candidates):
+                candidate = int(candidates[i])
+                strong_hashes = table[int(weaks[candidate])]
+                index = strong_hashes.get(Delta.strong_hash(data[chunk_start + candidate:chunk_start + candidate + block_size]))
+                if index is None:
+                    i += 1
+                    continue
+                yield chunk_start + candidate, index
+                # Skip the candidates inside the block
+                offset = chunk_start + candidate + block_size
+                i = int(np.searchsorted(candidates, offset - chunk_start))
+
+            offset = max(offset, chunk_start + count)
+
+class DeltaPatcher:
+    '''
+        Rebuilds the new file on the receiver from the instructions, as they arrive in order.
+        An instruction may be split across segments, its start is kept until the rest arrives.
+    '''
+    def __init__(self, file_name: str, block_size: int) -> None:
+        '''
+            Args:
+                file_name   (str): the earlier copy of the file, which copy instructions read from
+                block_size  (int): size of a block
+        '''
+        self.file = open(file_name, 'rb')
+        self.block_size = block_size
+        self.pending = b''  # Start of an instruction whose header has not all arrived
+        self.literal_left = 0   # Bytes of the current literal still to come
+
+    def feed(self, data: bytes):
+        '''
+            Runs on the receiver's writer thread, as copy instructions read from the old file.
+
+            Args:
+                data (bytes): the next in-order run of instructions
+            Yields:
+                bytes: the next runs of the new file, the blocks of a copy READ_CHUNK bytes at a time
+        '''
+        data = self.pending + data
+        i = 0
+        while i < len(data):
+            if self.literal_left:
+                run = data[i:i + self.literal_left]
+                yield run
+                self.literal_left -= len(run)
+                i += len(run)
+            elif data[i] == COPY:
+                if len(data) - i < 9: break
+                index, count = int.from_bytes(data[i + 1:i + 5], 'big'), int.from_bytes(data[i + 5:i + 9], 'big')
+                self.file.seek(index * self.block_size)
+                left = count * self.block_size
+                while left:
+                    run = self.file.read(min(left, READ_CHUNK))
+                    if not run: break   # Never past the end of the old file
+                    yield run
+                    left -= len(run)
+                i += 9
+            elif data[i] == LITERAL:
+                if len(data) - i < 5: break
+                self.literal_left = int.from_bytes(data[i + 1:i + 5], 'big')
+                i += 5
+            else:
+                raise ValueError(f'Invalid delta instruction {data[i]}')
+        self.pending = data[i:]
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,118 @@
+from src.enums import SegmentType
+from src.helpers.stp_helpers import Stp
+
+MAX_FEC_GROUP = 16   # Largest number of data segments covered by one parity segment
+
+# Create a FEC (parity) segment where:
+#  +------+------+------+------+------+------+------+------+
+#  |    type     |    seqno    |count |  length xor |parity|
+#  +-------------+------+------+------+------+------+------+
+# seqno is the seqno of the first data segment of the group, and the group is "count" consecutive
+# data segments. Every one of them is MSS bytes but the last segment of the file, so the receiver
+# finds them all from the first seqno. The parity is the XOR of their payloads, zero padded to the
+# longest one, and "length xor" the XOR of their lengths.
+class Fec:
+    @staticmethod
+    def create_parity_segment(first_seqno: int, count: int, length_xor: int, parity: bytes) -> bytes:
+        '''
+            Args:
+                first_seqno (int): seqno of the first data segment of the group
+                count       (int): number of data segments in the group
+                length_xor  (int): XOR of the payload lengths of the group
+                parity      (bytes): XOR of the payloads of the group
+            Returns:
+                bytes: STP FEC segment in bytes
+        '''
+        header = bytes([count]) + length_xor.to_bytes(2, byteorder="big")
+        return Stp.create_stp_segment(SegmentType.FEC, first_seqno, header + parity)
+
+    @staticmethod
+    def extract_parity(data: bytes):
+        '''
+            Args:
+                data (bytes): payload of a received FEC segment
+            Returns:
+                int     : number of data segments in the group
+                int     : XOR of the payload lengths of the group
+                bytes   : XOR of the payloads of the group
+        '''
+        return data[0], int.from_bytes(data[1:3], 'big'), data[3:]
+
+    @staticmethod
+    def group_size_for(loss_rate: float) -> int:
+        '''
+            One parity segment repairs one loss in its group. Pick the largest group in which
+            the expected number of losses (group + parity) stays at about a half.
+
+            Args:
+                loss_rate (float): observed fraction of segments lost
+            Returns:
+                int: number of data segments per parity segment, between 1 and MAX_FEC_GROUP
+        '''
+        if loss_rate <= 0: return MAX_FEC_GROUP
+        return max(1, min(MAX_FEC_GROUP, int(0.5 / loss_rate) - 1))
+
+class FecEncoder:
+    '''
+        Accumulates the XOR parity of consecutive new data segments on the sender.
+        Integers are used for the XOR since CPython XORs big integers far faster than it loops
+        over bytes. Payloads are read little endian so a shorter payload is zero padded at the end.
+    '''
+    __slots__ = ('group_size', 'is_adaptive', 'first_seqno', 'count', 'parity', 'max_length', 'length_xor')
+
+    def __init__(self, group_size: int, is_adaptive: bool = False) -> None:
+        '''
+            Args:
+                group_size  (int): number of data segments per parity segment
+                is_adaptive (bool, optional): whether group_size follows the observed loss rate
+        '''
+        self.group_size = group_size
+        self.is_adaptive = is_adaptive
+        self.reset()
+
+    def reset(self) -> None:
+        self.first_seqno = None
+        self.count = 0
+        self.parity = 0
+        self.max_length = 0
+        self.length_xor = 0
+
+    def add(self, seqno: int, data: bytes, is_last: bool = False) -> tuple:
+        '''
+            Add a new data segment to the current group.
+
+            Args:
+                seqno   (int): seqno of the data segment
+                data    (bytes): payload
+                is_last (bool, optional): whether this is the last data segment of the file,
+                which closes the group early
+            Returns:
+                int     : seqno of the first data segment of the group, once the group is complete
+                bytes   : the FEC segment to send, once the group is complete
+            or None while the group is not complete
+        '''
+        if self.first_seqno is None:
+            self.first_seqno = seqno
+        self.parity ^= int.from_bytes(data, 'little')
+        self.max_length = max(self.max_length, len(data))
+        self.length_xor ^= len(data)
+        self.count += 1
+
+        if self.count < self.group_size and not is_last:
+            return None
+
+        first_seqno = self.first_seqno
+        segment = Fec.create_parity_segment(first_seqno, self.count, self.length_xor,
+                                            self.parity.to_bytes(self.max_length, 'little'))
+        self.reset()
+        return first_seqno, segment
+
+    def adapt(self, loss_rate: float) -> None:
+        '''
+            Resize the next groups to the observed loss rate, if adaptive.
+
+            Args:
+                loss_rate (float): observed fraction of segments lost
+        '''
+        if self.is_adaptive and self.count == 0:
+            self.group_size = Fec.group_size_for(loss_rate)
@@ -1,12 +1,16 @@
 import time
 import random
 import os
+import hashlib
 from src.enums import LogActions, SegmentType
-from src.sender.sender_prototypes import SegmentControl, Segment, MSS
+from src.sender.sender_prototypes import SegmentControl
+from src.sender.scoreboard import Scoreboard
 
 # General helper functions
 MAX_SEQNO = 2**16
 class Helpers:
+    is_logging = True   # Whether log_message() writes the log files, the simulator turns this off
+
     @staticmethod
     def get_time_mls() -> float:
         '''
@@ -29,6 +33,7 @@ class Helpers:
             Returns:
                 None
         '''
+        if not Helpers.is_logging: return
         log_file = os.path.join(os.getcwd(), f"logs/{user}_log.txt")
         # if start_time == 0.0: time_diff = 0.0
         # else: time_diff = 
@@ -66,38 +71,71 @@ class Helpers:
 
     @staticmethod
     def is_dropped(prob: float) -> bool:
-        if random.random() <= prob: return True
+        # Without drops, leave the global generator alone
+        if prob > 0 and random.random() <= prob: return True
         return False
 
     @staticmethod
-    def create_segment_control(file_name: str, seqno: int) -> SegmentControl:
+    def hash_prefix(file_name: str, length: int):
+        '''
+            Args:
+                file_name   (str): file name to read
+                length      (int): number of bytes from the start of the file
+            Returns:
+                sha256 hash object of the first length bytes of the file, None if the file is
+                missing or shorter than that
+        '''
+        prefix_hash = hashlib.sha256()
+        try:
+            f = open(file_name, 'rb')
+        except OSError:
+            return None
+        with f:
+            while length > 0:
+                data = f.read(min(length, 2**20))
+                if not data: return None
+                prefix_hash.update(data)
+                length -= len(data)
+        return prefix_hash
+
+    @staticmethod
+    def create_segment_control(file_name: str, seqno: int, max_win: int, mss: int, offset: int = 0) -> SegmentControl:
         '''
             Create a segment control with all of its properties:
-                - segments: read each 1000 bytes max from given file, append them to list
-                - seqno_map: maps the sequence number of each segment to their index in "segments" list
+                - segments: read each MSS bytes max from given file, append them to list.
+                  The file is read in binary mode so every segment but the last is exactly MSS bytes
+                - scoreboard: tracks in-flight segments, sized to the window
             Args:
                 file_name   (str): file name to read
                 seqno       (int): sequence number after SYNSENT state
+                max_win     (int): max window size in bytes
+                mss         (int): agreed maximum segment size in bytes
+                offset      (int, optional): file offset to start from, when resuming a transfer
             Returns:
                 SegmentControl 
         '''
-        segments: list[Segment] = []
-        seqno_map = {}
-        curr_seqno = seqno
+        segments: list[bytes] = []
 
-        f = open(file_name, 'r')
+        f = open(file_name, 'rb')
+        f.seek(offset)
         while True:
-            data = f.read(MSS).encode()
+            data = f.read(mss)
 
             if not data: break
 
-            seqno_map[curr_seqno] = len(segments)
-            curr_seqno = Helpers.add_seqno(curr_seqno, len(data))
-            
-            segments.append(Segment(is_sent=False, data=data))
+            segments.append(data)
         
-        segment_control = SegmentControl(segments=segments, seqno_map=seqno_map)
+        segment_control = SegmentControl(segments=segments, scoreboard=Scoreboard(max_win, mss, seqno))
         
         f.close()
 
-        return segment_control
\ No newline at end of file
+        return segment_control
+
+    @staticmethod
+    def create_segment_control_from_bytes(data: bytes, seqno: int, max_win: int, mss: int) -> SegmentControl:
+        '''
+            Same as create_segment_control(), for data that is not read from a file: the
+            signatures the receiver sends in delta mode, or the delta the sender sends.
+        '''
+        segments = [data[i:i + mss] for i in range(0, len(data), mss)]
+        return SegmentControl(segments=segments, scoreboard=Scoreboard(max_win, mss, seqno))
\ No newline at end of file
@@ -0,0 +1,66 @@
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# The sender and receiver state machines only talk to the outside world through a Transport
+# (send segments) and a Clock (read the time, set timers). The real programs use a UDP socket
+# and threads, the simulator a simulated network and a virtual clock. Segments come in the
+# other way: the real programs read them from the socket and the simulator delivers them,
+# both straight to the handlers.
+
+class Clock(ABC):
+    @abstractmethod
+    def now(self) -> float:
+        '''
+            Returns:
+                float: current time in miliseconds
+        '''
+
+    @abstractmethod
+    def call_later(self, delay: float, function, args: tuple = ()):
+        '''
+            Call function(*args) once, after delay seconds.
+
+            Args:
+                delay       (float): seconds to wait
+                function    (callable): the timer handler
+                args        (tuple, optional): arguments for the handler
+            Returns:
+                a timer with a cancel() method. A handler may still run after cancel() if it had
+                already fired, so handlers must check they are still wanted.
+        '''
+
+class Transport(ABC):
+    @abstractmethod
+    def send(self, segment: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+class RealClock(Clock):
+    '''
+        Wall clock time, with a threading.Timer per timer.
+    '''
+    def now(self) -> float:
+        return round(time.time() * 1000, 2)
+
+    def call_later(self, delay: float, function, args: tuple = ()) -> threading.Timer:
+        timer = threading.Timer(delay, function, args)
+        timer.start()
+        return timer
+
+class UdpTransport(Transport):
+    '''
+        A UDP socket already connected to the other side.
+    '''
+    def __init__(self, sock: socket.socket) -> None:
+        self.socket = sock
+
+    def send(self, segment: bytes) -> None:
+        self.socket.send(segment)
+
+    def close(self) -> None:
+        self.socket.close()
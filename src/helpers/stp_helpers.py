@@ -1,4 +1,13 @@
-from src.enums import SegmentType
+from src.enums import SegmentType, SynOption
+
+HEADER_SIZE = 4     # Size of the type and seqno fields
+EXTRA_SIZE  = 256   # Room for the fields a segment carries besides data (window, SYN options, parity header)
+DEFAULT_MSS = 1000  # MSS used when the other side does not negotiate one
+OFFSET_SIZE = 8     # Size of the file offset in a RESUME option
+ACK_DELAY   = 0.04  # Longest an ACK waits for a data segment to carry it in duplex mode, in seconds
+ACK_WINDOW_SHARE = 3    # An ACK never waits once a third of the advertised window awaits it
+MAX_SEQNO   = 2**16 # Maximum sequence number
+MAX_MSS     = MAX_SEQNO // 3 # Largest MSS, a window must hold at least one segment and at most a third of the sequence space
 
 # Class Stp (simple transfer protocol) which contains methods that facilitates the use of protocol.
 class Stp:
@@ -10,6 +19,16 @@ class Stp:
     #  +------+------+------+------+------+------+
     #  |    type     |    seqno    |    data     |
     #  +-------------+------+-------------+------+
+    # An ACK segment carries the receiver's advertised window (4 bytes) in place of data.
+    # In duplex mode both sides send data, and a DATA_ACK segment carries the cumulative ACK
+    # (2 bytes) and advertised window (4 bytes) for the other direction before its data.
+    # A SYN segment carries options in place of data, a SYN ACK carries them after the window,
+    # and so does every other ACK with FEC, reporting how many data segments have arrived:
+    #  +------+------+------+------+------+
+    #  | kind |length|  value (length)    | ...
+    #  +------+------+------+------+------+
+    # The one exception is FAST_OPEN, which must come last: its length is 0 and its value, the
+    # data sent with the SYN, runs to the end of the segment. It can be larger than 255 bytes.
     # In normal methods within a function, we need "self" as a parameter.
     # Hence, use @staticmethod decorator to remove the need of self parameter.
     # This will also allow us to use these methods without initializing a class.
@@ -54,4 +73,158 @@ class Stp:
         if len(stp_segment) > 4: data = stp_segment[4:]
         else: data = None
 
-        return segmentType, seqno, data
\ No newline at end of file
+        return segmentType, seqno, data
+
+    @staticmethod
+    def buf_size(mss: int) -> int:
+        """Size of the buffer needed to receive any STP segment given the MSS.
+
+        Args:
+            mss (int): maximum segment size in bytes.
+
+        Returns:
+            int: buffer size in bytes.
+        """
+        return HEADER_SIZE + EXTRA_SIZE + mss
+
+    @staticmethod
+    def create_ack_segment(seqno: int, rwnd: int, options: bytes = b'') -> bytes:
+        """Create an ACK segment advertising how many bytes the receiver can take after seqno.
+
+        Args:
+            seqno   (int): The next sequence number the receiver expects.
+            rwnd    (int): The advertised receive window in bytes.
+            options (bytes, optional): Encoded options.
+
+        Returns:
+            bytes: STP ACK segment in bytes.
+        """
+        return Stp.create_stp_segment(SegmentType.ACK, seqno, rwnd.to_bytes(4, byteorder="big") + options)
+
+    @staticmethod
+    def extract_rwnd(data: bytes) -> int:
+        """Extract the advertised window from the payload of an ACK segment.
+
+        Args:
+            data (bytes): payload of the received ACK segment.
+
+        Returns:
+            int: advertised receive window in bytes, None if the ACK carries none.
+        """
+        if not data or len(data) < 4: return None
+        return int.from_bytes(data[:4], 'big')
+
+    @staticmethod
+    def extract_ack_options(data: bytes) -> dict:
+        """Extract the options an ACK carries after the advertised window.
+
+        Args:
+            data (bytes): payload of the received ACK segment.
+
+        Returns:
+            dict[SynOption, bytes]: option kind to its value
+        """
+        if not data: return {}
+        return Stp.extract_options(data[4:])
+
+    @staticmethod
+    def create_data_ack_segment(seqno: int, ack: int, rwnd: int, data: bytes) -> bytes:
+        """Create a DATA_ACK segment: data that also acknowledges the other direction.
+
+        Args:
+            seqno   (int): The sequence number of this segment.
+            ack     (int): The next sequence number expected from the other side.
+            rwnd    (int): The advertised receive window in bytes.
+            data    (bytes): payload
+
+        Returns:
+            bytes: STP DATA_ACK segment in bytes.
+        """
+        return Stp.create_stp_segment(SegmentType.DATA_ACK, seqno,
+                                      ack.to_bytes(2, byteorder="big") + rwnd.to_bytes(4, byteorder="big") + data)
+
+    @staticmethod
+    def extract_data_ack(data: bytes):
+        """Split the payload of a DATA_ACK segment.
+
+        Args:
+            data (bytes): payload of the received DATA_ACK segment.
+
+        Returns:
+            int     : the next sequence number the other side expects
+            int     : advertised receive window in bytes
+            bytes   : data
+        """
+        return int.from_bytes(data[:2], 'big'), int.from_bytes(data[2:6], 'big'), data[6:]
+
+    @staticmethod
+    def create_options(options: dict) -> bytes:
+        """Encode options as kind (1 byte), length (1 byte) and value.
+
+        Args:
+            options (dict[SynOption, bytes]): option kind to its value, at most 255 bytes,
+            except for FAST_OPEN which must be the last one.
+
+        Returns:
+            bytes: encoded options.
+        """
+        encoded = b''
+        for kind, value in options.items():
+            if kind == SynOption.FAST_OPEN:
+                # Early data runs to the end of the segment
+                encoded += bytes([kind.value, 0]) + value
+            else:
+                encoded += bytes([kind.value, len(value)]) + value
+        return encoded
+
+    @staticmethod
+    def extract_options(data: bytes) -> dict:
+        """Decode options encoded by create_options(). Unknown kinds are skipped.
+
+        Args:
+            data (bytes): encoded options, may be None.
+
+        Returns:
+            dict[SynOption, bytes]: option kind to its value
+        """
+        options = {}
+        i = 0
+        while data and i + 2 <= len(data):
+            kind, length = data[i], data[i + 1]
+            if kind == SynOption.FAST_OPEN.value:
+                options[SynOption.FAST_OPEN] = data[i + 2:]
+                break
+            try:
+                options[SynOption(kind)] = data[i + 2:i + 2 + length]
+            except ValueError:
+                pass
+            i += 2 + length
+        return options
+
+    @staticmethod
+    def create_resume_option(offset: int, digest: bytes) -> bytes:
+        """Encode the value of the RESUME option of a SYN ACK: the file offset to resume from
+        (8 bytes) and the sha256 digest of the file up to there. The SYN asks to resume with
+        an empty RESUME option.
+
+        Args:
+            offset (int): number of bytes the receiver already has.
+            digest (bytes): sha256 digest of those bytes.
+
+        Returns:
+            bytes: option value.
+        """
+        return offset.to_bytes(OFFSET_SIZE, byteorder="big") + digest
+
+    @staticmethod
+    def extract_resume_option(value: bytes):
+        """Decode the value of the RESUME option of a SYN ACK.
+
+        Args:
+            value (bytes): option value.
+
+        Returns:
+            int     : file offset to resume from
+            bytes   : sha256 digest of the file up to there
+        """
+        return int.from_bytes(value[:OFFSET_SIZE], 'big'), value[OFFSET_SIZE:]
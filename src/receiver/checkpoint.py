@@ -0,0 +1,68 @@
+import os
+from src.helpers.helpers import Helpers
+
+CHECKPOINT_SUFFIX   = '.ckpt'   # The checkpoint of "received.txt" is "received.txt.ckpt"
+CHECKPOINT_INTERVAL = 2**20     # Bytes written between two checkpoints
+OFFSET_SIZE = 8     # Size of the offset field
+DIGEST_SIZE = 32    # Size of a sha256 digest
+
+# A checkpoint records how much of the output file has been written:
+#  +------+------+------+------+------+------+
+#  |    offset (8 bytes)  |  sha256 (32 bytes) |
+#  +------+------+------+------+------+------+
+# where sha256 is the digest of the first "offset" bytes of the output file. The receiver sends
+# both in the RESUME option of its SYN ACK, and the sender only resumes from there if its own
+# file has the same digest up to that offset.
+class Checkpoint:
+    @staticmethod
+    def path(file_name: str) -> str:
+        return file_name + CHECKPOINT_SUFFIX
+
+    @staticmethod
+    def save(file_name: str, offset: int, digest: bytes) -> None:
+        '''
+            Args:
+                file_name   (str): name of the output file
+                offset      (int): number of bytes written to the output file
+                digest      (bytes): sha256 digest of those bytes
+        '''
+        # Write a temporary file and rename it over the old checkpoint, so a crash never leaves half of one
+        tmp_path = Checkpoint.path(file_name) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(offset.to_bytes(OFFSET_SIZE, byteorder="big") + digest)
+        os.replace(tmp_path, Checkpoint.path(file_name))
+
+    @staticmethod
+    def load(file_name: str):
+        '''
+            Read the checkpoint of an output file and check the file still matches it. The file is
+            read up to the checkpoint again, since data the checkpoint counts may never have reached
+            the disk (without fsync), or the file may have been changed since.
+
+            Args:
+                file_name (str): name of the output file
+            Returns:
+                int     : offset to resume from
+                sha256  : hash object of the file up to that offset, to carry on hashing from
+            or None if there is no valid checkpoint
+        '''
+        try:
+            with open(Checkpoint.path(file_name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != OFFSET_SIZE + DIGEST_SIZE:
+            return None
+
+        offset = int.from_bytes(data[:OFFSET_SIZE], 'big')
+        prefix_hash = Helpers.hash_prefix(file_name, offset)
+        if prefix_hash is None or prefix_hash.digest() != data[OFFSET_SIZE:]:
+            return None
+        return offset, prefix_hash
+
+    @staticmethod
+    def remove(file_name: str) -> None:
+        try:
+            os.remove(Checkpoint.path(file_name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,118 @@
+import threading
+from dataclasses import dataclass
+from src.helpers.helpers import MAX_SEQNO
+from src.helpers.runtime import Clock
+from src.helpers.stp_helpers import ACK_DELAY, ACK_WINDOW_SHARE
+from src.receiver.reassembly import ReassemblyWindow
+
+# The receive side of a connection, shared by both endpoints: the receiver for the file, and in
+# duplex mode the sender for the reply. Data is reassembled and handed to the writer, then ACKed.
+#
+# In duplex mode the ACK rides on the next data segment going the other way (DATA_ACK), through
+# ack_info(). An ACK only goes out on its own when data arrives out of order, when there is no
+# new data left to carry it, when the other side is running short of window, or when none has
+# gone out within the ACK delay.
+
+@dataclass
+class AckControl:
+    """ACK control block: when to ACK the data received"""
+    clock: Clock                # Sets the delayed ACK timer
+    lock: threading.Lock        # The endpoint's lock, held by every handler
+    send_ack: callable          # Sends an ACK on its own right away, with ack_info()
+    is_closed: bool = False     # Set once the endpoint has closed, a delayed ACK timer then does nothing
+    is_ack_pending: bool = False    # whether data has arrived that no segment has ACKed yet
+    ack_timer: object = None        # The delayed ACK timer, from clock.call_later()
+    unacked_bytes: int = 0          # In-order data received since the latest ACK went out
+    last_rwnd: int = 0              # Window advertised in the latest ACK
+
+class DelayedAck:
+    @staticmethod
+    def on_data(ack_control: AckControl, buff: ReassemblyWindow, writer, seqno: int, data: bytes,
+                can_piggyback: bool = True) -> None:
+        '''
+            Take in a data segment, hand the in-order data to the writer, and ACK it now or leave
+            the ACK to the next data segment we send.
+
+            Args:
+                ack_control   (AckControl): ACK state of the endpoint
+                buff          (ReassemblyWindow): The reassembly window.
+                writer        (DiskWriter): takes the in-order data
+                seqno         (int): seqno of the segment
+                data          (bytes): its payload
+                can_piggyback (bool, optional): False when we send no data the ACK could ride on
+        '''
+        expct_seqno = buff.expct_seqno
+        # Place the segment in its slot. Old, duplicate and out-of-window segments are dropped by
+        # the window itself, we still ACK them. Then hand the whole run of in-order data now at the
+        # front of the window to the writer. It may start at an earlier segment, if this one let a
+        # parity segment rebuild it.
+        buff.insert(seqno, data)
+        writer.submit(buff.deliver())
+
+        advance = (buff.expct_seqno - expct_seqno) % MAX_SEQNO
+        if not can_piggyback or advance == 0 or advance > len(data):
+            # Out of order data is always ACKed at once, the duplicate ACK tells the other side
+            # what is missing. So is a segment that fills a gap, which ends the recovery.
+            ack_control.send_ack()
+        else:
+            ack_control.is_ack_pending = True
+            ack_control.unacked_bytes += advance
+
+    @staticmethod
+    def ack_info(ack_control: AckControl, buff: ReassemblyWindow, writer):
+        '''
+            The ACK for the data received so far, about to go out on its own or on a data segment.
+
+            Returns:
+                int: the next seqno we expect
+                int: the window to advertise, the free space left once the writer's backlog is taken away
+        '''
+        buff.backlog = writer.backlog
+        ack_control.last_rwnd = buff.advertised_window()
+        ack_control.is_ack_pending = False
+        ack_control.unacked_bytes = 0
+        if ack_control.ack_timer:
+            ack_control.ack_timer.cancel()
+            ack_control.ack_timer = None
+        return buff.expct_seqno, ack_control.last_rwnd
+
+    @staticmethod
+    def after_segment(ack_control: AckControl, has_new_data: bool, rto: float) -> None:
+        '''
+            Called once an endpoint has handled a segment. If no data segment went out to carry
+            the ACK, give the next one a moment to, provided there is new data left to send and
+            the other side still has plenty of window left. Otherwise ACK on its own right away.
+
+            Args:
+                ack_control  (AckControl): ACK state of the endpoint
+                has_new_data (bool): whether we have new data to send
+                rto          (float): RTO the other side sends with, the delay stays well below it
+        '''
+        if not ack_control.is_ack_pending:
+            return
+        if has_new_data and ack_control.unacked_bytes < ack_control.last_rwnd // ACK_WINDOW_SHARE:
+            if ack_control.ack_timer is None:
+                ack_control.ack_timer = ack_control.clock.call_later(min(ACK_DELAY, rto / 4), DelayedAck.on_ack_delay,
+                                                                     (ack_control,))
+        else:
+            ack_control.send_ack()
+
+    @staticmethod
+    def on_ack_delay(ack_control: AckControl) -> None:
+        '''
+            Called once the ACK delay is over and no data segment has carried the ACK.
+        '''
+        with ack_control.lock:
+            ack_control.ack_timer = None
+            if not ack_control.is_closed and ack_control.is_ack_pending:
+                ack_control.send_ack()
+
+    @staticmethod
+    def close(ack_control: AckControl) -> None:
+        '''
+            Stop delaying ACKs, the endpoint has closed.
+        '''
+        ack_control.is_closed = True
+        if ack_control.ack_timer:
+            ack_control.ack_timer.cancel()
+            ack_control.ack_timer = None
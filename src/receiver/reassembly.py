@@ -0,0 +1,207 @@
+from array import array
+from src.enums import InsertStatus
+from src.helpers.helpers import MAX_SEQNO
+
+class ReassemblyWindow:
+    '''
+        Fixed-size reassembly window for the receiver.
+
+        The window is a preallocated byte arena split into MSS sized slots, plus an occupancy
+        bitmap and a length per slot. A segment lives in the slot given by its offset from the
+        expected seqno (modular arithmetic), so inserting is O(1) and delivering an in-order run
+        is O(run length). Memory per connection is fixed at max_win bytes.
+
+        The window advertised to the sender is the space left once the data delivered but not yet
+        written out (backlog) is taken away, and segments beyond it are dropped.
+
+        Every segment of a stream is exactly MSS bytes except the very last one, which may be
+        shorter. That keeps every offset within the window a multiple of MSS.
+
+        With FEC, the arena keeps "history" extra slots so the last delivered segments stay
+        readable, and a parity segment can rebuild the one missing segment of its group from
+        the others even when some of them have already been delivered.
+    '''
+    __slots__ = ('mss', 'num_slots', 'history', 'total_slots', 'capacity', 'arena', 'lengths', 'bitmap',
+                 'head', 'expct_seqno', 'backlog', 'pending_parity', 'parity_groups', 'total_received',
+                 'total_recovered')
+
+    def __init__(self, max_win: int, mss: int, expct_seqno: int, history: int = 0) -> None:
+        '''
+            Args:
+                max_win     (int): maximum window size in bytes
+                mss         (int): maximum segment size in bytes
+                expct_seqno (int): sequence number of the first in-order byte
+                history     (int, optional): number of delivered segments kept readable for FEC
+        '''
+        self.mss = mss
+        self.num_slots = max(1, max_win // mss)
+        self.history = history
+        self.total_slots = self.num_slots + history
+        self.capacity = self.num_slots * mss
+        self.arena = bytearray(self.total_slots * mss)
+        self.lengths = array('I', [0]) * self.total_slots
+        self.bitmap = bytearray(self.total_slots)
+        # The slot where the next in-order segment (expct_seqno) lives
+        self.head = 0
+        self.expct_seqno = expct_seqno
+        # Bytes delivered but not yet written out
+        self.backlog = 0
+        # Parity segments that could not repair their group yet, by the first seqno of the group,
+        # and the group of every segment they cover, so a new segment only tries its own group
+        self.pending_parity: dict[int, tuple] = {}
+        self.parity_groups: dict[int, int] = {}
+        self.total_received = 0     # Segments handed to insert(), duplicates and out-of-window ones included
+        self.total_recovered = 0    # Segments rebuilt from a parity segment
+
+    def advertised_window(self) -> int:
+        '''
+            Returns:
+                int: number of bytes after expct_seqno the receiver can take, a multiple of MSS
+        '''
+        free_space = max(0, self.capacity - self.backlog)
+        return free_space - free_space % self.mss
+
+    def insert(self, seqno: int, data: bytes) -> InsertStatus:
+        '''
+            Place a received segment into its slot.
+
+            The offset from expct_seqno is taken MOD MAX_SEQNO. Offsets in the upper half of the
+            sequence space are behind expct_seqno, so that segment has already been delivered.
+
+            Args:
+                seqno (int): sequence number of the received segment
+                data  (bytes): payload
+            Returns:
+                InsertStatus: IN_ORDER if the segment sits at expct_seqno (call deliver()),
+                BUFFERED if it was stored out of order, DUPLICATE if it was already received,
+                OUT_OF_WINDOW if it does not fit in the window.
+        '''
+        self.total_received += 1
+        status = self.place(seqno, data)
+        # A new segment may complete the group a parity segment is waiting on
+        if self.parity_groups and status in (InsertStatus.IN_ORDER, InsertStatus.BUFFERED):
+            first_seqno = self.parity_groups.get(seqno)
+            if first_seqno is not None and self.recover(first_seqno, *self.pending_parity[first_seqno]) is not None:
+                self.drop_parity(first_seqno)
+        return status
+
+    def insert_parity(self, first_seqno: int, count: int, length_xor: int, parity: bytes) -> bool:
+        '''
+            Use a parity segment to rebuild the missing segment of its group. If more than one
+            segment of the group is missing, keep the parity until all but one have arrived.
+
+            Args:
+                first_seqno (int): seqno of the first data segment of the group
+                count       (int): number of data segments in the group
+                length_xor  (int): XOR of the payload lengths of the group
+                parity      (bytes): XOR of the payloads of the group
+            Returns:
+                bool: True if a segment was rebuilt (call deliver())
+        '''
+        recovered = self.recover(first_seqno, count, length_xor, parity)
+        if recovered is None:
+            if first_seqno in self.pending_parity:
+                self.drop_parity(first_seqno)
+            # Never keep more parity segments than there are groups in the window. The oldest
+            # is the likeliest to be past repair, its group may have left the window since.
+            if len(self.pending_parity) >= self.num_slots:
+                self.drop_parity(next(iter(self.pending_parity)))
+            self.pending_parity[first_seqno] = (count, length_xor, parity)
+            for i in range(count):
+                self.parity_groups[(first_seqno + i * self.mss) % MAX_SEQNO] = first_seqno
+            return False
+        return recovered
+
+    def drop_parity(self, first_seqno: int) -> None:
+        count = self.pending_parity.pop(first_seqno)[0]
+        for i in range(count):
+            seqno = (first_seqno + i * self.mss) % MAX_SEQNO
+            if self.parity_groups.get(seqno) == first_seqno:
+                del self.parity_groups[seqno]
+
+    def recover(self, first_seqno: int, count: int, length_xor: int, parity: bytes) -> bool:
+        '''
+            Returns:
+                bool: True if the missing segment was rebuilt, False if the group needs no repair
+                or can no longer be repaired, None if more than one segment is still missing
+        '''
+        # Find the slot of every segment of the group first, which is cheap, and only XOR
+        # the payloads once exactly one segment is missing
+        slots = []
+        missing_seqno = None
+        for i in range(count):
+            seqno = (first_seqno + i * self.mss) % MAX_SEQNO
+            # Signed offset from expct_seqno, negative for a delivered segment
+            offset = (seqno - self.expct_seqno) % MAX_SEQNO
+            if offset >= MAX_SEQNO // 2:
+                offset -= MAX_SEQNO
+            if offset % self.mss != 0 or offset < -self.history * self.mss or offset >= self.capacity:
+                return False
+
+            slot = (self.head + offset // self.mss) % self.total_slots
+            if offset >= 0 and not self.bitmap[slot]:
+                if missing_seqno is not None:
+                    return None
+                missing_seqno = seqno
+            else:
+                slots.append(slot)
+
+        if missing_seqno is None:
+            return False
+
+        parity_int = int.from_bytes(parity, 'little')
+        for slot in slots:
+            start = slot * self.mss
+            parity_int ^= int.from_bytes(self.arena[start:start + self.lengths[slot]], 'little')
+            length_xor ^= self.lengths[slot]
+        if not (0 < length_xor <= len(parity)):
+            return False
+
+        status = self.place(missing_seqno, parity_int.to_bytes(len(parity), 'little')[:length_xor])
+        if status not in (InsertStatus.IN_ORDER, InsertStatus.BUFFERED):
+            return False
+        self.total_recovered += 1
+        return True
+
+    def place(self, seqno: int, data: bytes) -> InsertStatus:
+        offset = (seqno - self.expct_seqno) % MAX_SEQNO
+        if offset >= MAX_SEQNO // 2:
+            return InsertStatus.DUPLICATE
+
+        length = len(data)
+        if length > self.mss or offset % self.mss != 0 or offset + length > self.advertised_window():
+            return InsertStatus.OUT_OF_WINDOW
+
+        slot = (self.head + offset // self.mss) % self.total_slots
+        if self.bitmap[slot]:
+            return InsertStatus.DUPLICATE
+
+        start = slot * self.mss
+        self.arena[start:start + length] = data
+        self.lengths[slot] = length
+        self.bitmap[slot] = 1
+
+        return InsertStatus.IN_ORDER if offset == 0 else InsertStatus.BUFFERED
+
+    def deliver(self) -> bytes:
+        '''
+            Pop the run of contiguous segments starting at expct_seqno, freeing their slots
+            and sliding the window forward. Their bytes stay in the arena as history.
+
+            Returns:
+                bytes: in-order data, empty if the segment at expct_seqno is still missing
+        '''
+        runs = []
+        while self.bitmap[self.head]:
+            length = self.lengths[self.head]
+            start = self.head * self.mss
+            runs.append(self.arena[start:start + length])
+
+            self.bitmap[self.head] = 0
+            self.expct_seqno = (self.expct_seqno + length) % MAX_SEQNO
+            self.head = (self.head + 1) % self.total_slots
+
+            # A short segment is the last one of the stream
+            if length < self.mss: break
+
+        return b''.join(runs)
@@ -10,6 +10,7 @@
 # Changes to the log output.
 ###
 
+import random
 import socket
 import traceback
 import sys
@@ -18,14 +19,21 @@ import os
 from dataclasses import dataclass
 from src.helpers.arg_parser import ArgParser
 from src.helpers.helpers import Helpers
-from src.enums import LogActions, SegmentType
-from src.helpers.stp_helpers import Stp
+from src.enums import LogActions, SegmentType, FsyncPolicy, SynOption
+from src.helpers.stp_helpers import Stp, DEFAULT_MSS, MAX_MSS
+from src.receiver.reassembly import ReassemblyWindow
+from src.receiver.delayed_ack import AckControl, DelayedAck
+from src.receiver.writer import DiskWriter
+from src.receiver.checkpoint import Checkpoint
+from src.helpers.fec import Fec
+from src.helpers.delta import Delta, DeltaPatcher, DELTA_SUFFIX
+from src.helpers.runtime import Transport, Clock, RealClock, UdpTransport
+from src.sender.sender_prototypes import Control as SenderControl
+from src.sender.states import States
 
 
 NUM_ARGS = 4  # Number of command-line arguments
-BUF_SIZE = 1004  # Size of buffer for sending/receiving STP segments
 MAX_SEQNO = 2**16 # Maximum sequence number
-MSS = 1000 # Maximum segment (data) size
 MSL = 1    # Maximum Segment Lifetime = 1 second 
 @dataclass
 class Control:
@@ -35,192 +43,358 @@ class Control:
     sender_port:int             # Port number of the sender
     output_file:str             # name of output file
     max_win:    int             # maximum window size for receiver buffer
-    socket: socket
+    max_mss:    int             # largest MSS the receiver agrees to
+    transport: Transport        # Sends segments, a connected UDP socket or the simulated network
+    clock: Clock                # Time and timers, real or virtual
+    fsync_policy: FsyncPolicy = FsyncPolicy.NONE # when the output file is fsynced
+    writer: DiskWriter = None   # Write-behind stage that owns the output file
+    writer_class: type = DiskWriter # Class of the writer, the simulator keeps the file in memory instead
+    buff: ReassemblyWindow = None   # Reassembly window, created on the SYN
+    ack_control: AckControl = None  # When to ACK, created on the SYN
+    lock: threading.Lock = None # held while handling a segment or a timeout
+    on_closed: callable = None  # called once the receiver has closed, the real receiver exits there
     start_time: float = 0.0     # Time at which first packet received
     is_alive: bool = True       # Flag variable, will be switched to False if it receive FIN segment.
+    is_first_segment: bool = True   # Whether no segment has been received yet
+    mss: int = DEFAULT_MSS      # MSS agreed with the sender in the SYN ACK
+    syn_seqno: int = None       # seqno of the SYN of the current connection
+    syn_ack_options: bytes = b''    # Options of our SYN ACK, sent again for a retransmitted SYN
+    is_fec: bool = False        # Whether the sender uses FEC, then ACKs report how many data segments arrived
+    buf_size: int = 0           # Size of buffer for receiving STP segments, derived from the MSS
+    reply_file: str = None      # file to send back to the sender in duplex mode
+    reply: SenderControl = None # Sender side of the reply, when the sender asked for one
+    early_segments: list = None     # (seqno, data) of data segments that arrived before the first SYN
+    patcher: DeltaPatcher = None    # In delta mode, rebuilds the file from the instructions the sender sends, on the writer thread
+    rng: random.Random = None   # Draws the ISN of the reply, the global generator when None
 
-class LRU_Acked_Cache:
-    def __init__(self, max_queue_size: int) -> None:
-        self.acked_map: dict[int, bool] = {}
-        self.acked_queue: list[int] = []
-        self.MAX_QUEUE_SIZE = max_queue_size
-
-    def find(self, seqno: int) -> bool:
-        '''
-            Args:
-                seqno (int): sequence number of a segment
-            Returns:
-                bool: returns True if recently received segment of seqno, False otherwise.
-        '''
-        return self.acked_map.get(seqno, False) != False
-
-    def add_seqno(self, seqno: int) -> None:
-        '''
-            Add a recently received seqno into cache. If number of seqno saved exceeds (MAX_WIN/1000)*2, 
-            pop the first elem out and delete it from dictionary.
-            The choice of (MAX_WIN/1000)*2 might not be the most optimal number, but I just play safe here.
-            Didn't check for duplicate as I assume it's relatively rare for duplicates to occur.
-
-            Args:
-                seqno (int): sequence number of a segment
-            Returns:
-                None
-        '''
-        self.acked_map[seqno] = True
-        self.acked_queue.append(seqno)
-
-        if len(self.acked_queue) == self.MAX_QUEUE_SIZE:
-            lru_seqno = self.acked_queue.pop(0)
-            self.acked_map.pop(lru_seqno)
+def on_close(control: Control):
+    '''
+        This function will be called after 2 seconds since receive of FIN
+        to switch "is_alive" flag to false, which will terminate this program.
+    '''
+    with control.lock:
+        # A FIN retransmitted after the first one sets another timer
+        if not control.is_alive:
+            return
+        control.is_alive = False
+        stop_reply(control)
+        DelayedAck.close(control.ack_control)
+        # Everything has been received, there is nothing left to resume
+        try:
+            control.writer.close(is_complete=True)
+        except OSError as e:
+            print(f'Could not write {control.output_file}: {e}')
+        if control.patcher:
+            control.patcher.close()
+        control.transport.close()
+        print('Receiver Closed!')
+    if control.on_closed:
+        control.on_closed()
+
+def send_ack(control: Control, buff: ReassemblyWindow, seqno: int, options: bytes = b'') -> None:
+    '''
+        Send an ACK segment advertising the free space left once the writer's backlog is taken away.
 
+        Args:
+            control (Control): The control block for the receiver program.
+            buff    (ReassemblyWindow): The reassembly window.
+            seqno   (int): The sequence number to acknowledge.
+            options (bytes, optional): Encoded options of a SYN ACK.
+    '''
+    _, rwnd = DelayedAck.ack_info(control.ack_control, buff, control.writer)
+    # With FEC the sender cannot tell the losses parity repaired from its retransmissions,
+    # so tell it how many data segments arrived, for its loss rate
+    if control.is_fec and not options:
+        options = Stp.create_options({SynOption.RECEIVED: buff.total_received.to_bytes(4, byteorder="big")})
+
+    ack_segment = Stp.create_ack_segment(seqno, rwnd, options)
+    control.transport.send(ack_segment)
+
+    Helpers.log_message('receiver', LogActions.SEND, control.start_time, SegmentType.ACK, seqno, 0)
+
+def deliver(control: Control, buff: ReassemblyWindow) -> None:
+    '''
+        Hand the run of in-order data at the front of the window to the writer. In delta mode
+        these are instructions, the writer rebuilds the file from them.
+    '''
+    control.writer.submit(buff.deliver())
+
+def start_reply(control: Control, duplex: bytes, payload: bytes = None) -> bytes:
+    '''
+        Start sending the reply file back to the sender, once the SYN ACK is on its way.
+        The reply runs the sender's state machine, on our socket and under our lock.
+
+        Args:
+            control (Control): The control block for the receiver program.
+            duplex  (bytes): value of the DUPLEX option of the SYN: the sender's window (4 bytes)
+            and RTO in miliseconds (4 bytes)
+            payload (bytes, optional): data to send instead of the reply file, the signatures in delta mode
+        Returns:
+            bytes: value of the DUPLEX option of the SYN ACK, the ISN of the reply
+    '''
+    reply_isn = (control.rng or random).randrange(MAX_SEQNO)
+    control.reply = SenderControl(sender_port=control.rcvr_port, rcvr_port=control.sender_port,
+                                  max_win=control.max_win, rto=int.from_bytes(duplex[4:8], 'big') / 1000,
+                                  seqno=Helpers.add_seqno(reply_isn, 1), file_name=control.reply_file,
+                                  flp=0.0, rlp=0.0, transport=control.transport, clock=control.clock,
+                                  lock=control.lock, is_connected=True, start_time=control.start_time,
+                                  rwnd=int.from_bytes(duplex[:4], 'big'), mss=control.mss,
+                                  piggyback=lambda: DelayedAck.ack_info(control.ack_control, control.buff, control.writer),
+                                  user='receiver', payload=payload)
+    return reply_isn.to_bytes(2, byteorder="big")
+
+def stop_reply(control: Control) -> None:
+    '''
+        Stop the reply, on a FIN or a new connection. Its timers find it closed and do nothing.
+    '''
+    reply = control.reply
+    if reply is None:
         return
-    
+    reply.is_est_state = False
+    reply.is_closed = True
+    if reply.timer:
+        reply.timer.cancel()
+        reply.timer = None
 
-@dataclass
-class Buffer:
-    """Control block: parameters for the receiver buffer."""
-    # ================== Update arguments =====================
-    buffer:     list[bytes]    # Buffer that saves received data
-    expct_seqno:int     # The expected sequence number when receive next packet
-    index:      int     # The index where the next in-order packet lives in buffer
-    max_size:   int     # The maximum size of buffer
-    lru_seqno: LRU_Acked_Cache # a class to keep track of recently received Acked segments
+def window_update(control: Control, buff: ReassemblyWindow) -> None:
+    '''
+        Called by the writer once it has drained its queue. If the latest ACK closed the window,
+        tell the sender it has reopened instead of waiting for its next zero window probe.
+    '''
+    # Never wait for the lock: whoever holds it is handling a segment and sends an ACK anyway,
+    # or is closing the writer, which waits for this thread.
+    if not control.lock.acquire(blocking=False):
+        return
+    try:
+        if control.is_alive and control.ack_control.last_rwnd < control.mss:
+            send_ack(control, buff, buff.expct_seqno)
+    finally:
+        control.lock.release()
 
-def timeout_thread(control: Control):
+def handle_segment(control: Control, receive: bytes) -> None:
     '''
-        This function will be called after 2 seconds since receive of FIN
-        to switch "is_alive" flag to false, which will terminate this program.
+        Handle one segment from the sender and ACK it.
+
+        Args:
+            control (Control): The control block for the receiver program.
+            receive (bytes): the received STP segment
     '''
-    control.socket.close()
-    f.close()
-    print('Receiver Closed!')
-    os._exit(os.EX_OK)
-    return
+    with control.lock:
+        if not control.is_alive:
+            return
+
+        segmentType, seqno, data = Stp.extract_stp_segment(receive)
+        if control.is_first_segment:
+            control.is_first_segment = False
+            # First rcv message is a SYN, or with 0-RTT maybe a data segment sent right behind it
+            Helpers.log_message('receiver', LogActions.RECEIVE, 0.0, segmentType, seqno, 0)
+        else:
+            Helpers.log_message('receiver', LogActions.RECEIVE, control.start_time, segmentType, seqno, 0 if not data else len(data))            
+
+        buff = control.buff
+        if segmentType == SegmentType.SYN:
+            print('receieve SYN from sender')
+            # A retransmitted SYN of the current connection only needs the same SYN ACK again
+            if seqno == control.syn_seqno:
+                send_ack(control, buff, Helpers.add_seqno(seqno, 1), control.syn_ack_options)
+                return
+            control.syn_seqno = seqno
+
+            # For SYN segment, add 1 to seqno
+            seqno = Helpers.add_seqno(seqno, 1)
+
+            # Agree on the smaller of the MSS the sender proposed, our own limit and our window,
+            # and size everything after it
+            syn_options = Stp.extract_options(data)
+            proposed_mss = int.from_bytes(syn_options[SynOption.MSS], 'big') if SynOption.MSS in syn_options else DEFAULT_MSS
+            control.mss = min(proposed_mss, control.max_mss, control.max_win)
+            # Data sent with the SYN and right behind it was split with the proposed MSS. It only
+            # fits our window if we agree to that MSS, and it starts the file, so not when resuming.
+            is_early_data = (SynOption.FAST_OPEN in syn_options and control.mss == proposed_mss
+                             and SynOption.RESUME not in syn_options and SynOption.DELTA not in syn_options)
+            early_segments = control.early_segments or []
+            control.early_segments = None
+            control.buf_size = Stp.buf_size(control.mss)
+
+            # Initialize reassembly window. With FEC, keep the segments of a group readable
+            # after they are delivered, so a parity segment can still use them.
+            control.is_fec = SynOption.FEC in syn_options
+            fec_group = syn_options[SynOption.FEC][0] if control.is_fec else 1
+            buff = control.buff = ReassemblyWindow(control.max_win, control.mss, seqno, history=fec_group - 1)
+
+            # A new SYN while connected means the sender restarted: write out what the previous
+            # connection received, which also takes its checkpoint, and drop the reply it had.
+            if control.writer is not None:
+                control.writer.close()
+            if control.patcher:
+                control.patcher.close()
+                control.patcher = None
+            stop_reply(control)
+            control.reply = None
+            if control.ack_control:
+                DelayedAck.close(control.ack_control)
+            control.ack_control = AckControl(control.clock, control.lock,
+                                             lambda: send_ack(control, control.buff, control.buff.expct_seqno))
+
+            # If the sender asks to resume, keep the output file up to the checkpoint, provided the
+            # file still matches it. Otherwise start the file over.
+            offset, prefix_hash = 0, None
+            if SynOption.RESUME in syn_options:
+                checkpoint = Checkpoint.load(control.output_file)
+                if checkpoint:
+                    offset, prefix_hash = checkpoint
+                    print(f'resume from {offset}')
+
+            # Delta mode: if we have an earlier copy of the file, send the sender the signatures of
+            # its blocks, and rebuild the new file from the copy and what the sender sends. The new
+            # file is written under a temporary name, and only replaces the copy once complete.
+            signatures = None
+            if (SynOption.DELTA in syn_options and SynOption.DUPLEX in syn_options and not offset
+                    and control.output_file and os.path.isfile(control.output_file)
+                    and os.path.getsize(control.output_file) > 0):
+                block_size = Delta.block_size_for(os.path.getsize(control.output_file))
+                signatures = Delta.create_signatures(control.output_file, block_size)
+                control.patcher = DeltaPatcher(control.output_file, block_size)
+                print(f'delta mode, {len(signatures)} bytes of signatures for blocks of {block_size} bytes')
+
+            # Open the output file behind a writer thread, so disk latency never stalls the packet loop.
+            # Every queued run holds at least one segment, so the queue never holds more runs than
+            # the window has slots.
+            write_file, final_name = control.output_file, None
+            if control.patcher:
+                write_file, final_name = control.output_file + DELTA_SUFFIX, control.output_file
+            control.writer = control.writer_class(write_file, control.fsync_policy, buff.num_slots,
+                                                  on_drain=lambda: window_update(control, control.buff),
+                                                  offset=offset, prefix_hash=prefix_hash, final_name=final_name,
+                                                  patcher=control.patcher)
+
+            # Send back ACK segment with the agreed MSS, and where to resume from with the digest
+            # of the file up to there, for the sender to check against its own
+            syn_ack_options = {SynOption.MSS: control.mss.to_bytes(2, byteorder="big")}
+            if offset:
+                syn_ack_options[SynOption.RESUME] = Stp.create_resume_option(offset, prefix_hash.digest())
+            # The sender asked for a reply and we have one: tell it where the reply starts
+            if signatures is not None:
+                syn_ack_options[SynOption.DUPLEX] = start_reply(control, syn_options[SynOption.DUPLEX], signatures)
+                syn_ack_options[SynOption.DELTA] = control.patcher.block_size.to_bytes(4, byteorder="big")
+            elif SynOption.DUPLEX in syn_options and SynOption.DELTA not in syn_options and control.reply_file:
+                syn_ack_options[SynOption.DUPLEX] = start_reply(control, syn_options[SynOption.DUPLEX])
+
+            # 0-RTT: take the data of the SYN and whatever arrived before it, and tell the sender
+            # we did, so it carries on from there instead of sending it all again
+            if is_early_data:
+                for early_seqno, early_data in [(seqno, syn_options[SynOption.FAST_OPEN])] + early_segments:
+                    buff.insert(early_seqno, early_data)
+                deliver(control, buff)
+                syn_ack_options[SynOption.FAST_OPEN] = b''
+            elif SynOption.FAST_OPEN in syn_options:
+                print('Drop the data sent with the SYN')
+
+            control.syn_ack_options = Stp.create_options(syn_ack_options)
+            send_ack(control, buff, seqno, control.syn_ack_options)
+            # The SYN ACK only ACKs the SYN, the early data gets an ACK of its own
+            control.ack_control.is_ack_pending = is_early_data
+
+            # The reply starts right away, without waiting for the sender's first segment
+            if control.reply:
+                States.state_est(control.reply)
+        elif buff is None:
+            # Nothing but a SYN makes sense before the connection is set up. Keep a window of data
+            # segments though, which a 0-RTT sender sends right behind a SYN that may arrive later.
+            if segmentType == SegmentType.DATA:
+                control.early_segments = control.early_segments or []
+                if sum(len(d) for _, d in control.early_segments) + len(data) <= control.max_win:
+                    control.early_segments.append((seqno, data))
+            return
+        elif segmentType == SegmentType.FIN:
+            print('receive FIN from sender')
+            # For FIN segment, add 1 to seqno
+            seqno = Helpers.add_seqno(seqno, 1)
+
+            # Send back ACK segment
+            send_ack(control, buff, seqno)
+
+            # The sender only closes once it has the whole reply
+            stop_reply(control)
+
+            control.clock.call_later(2 * MSL, on_close, (control,))
+        elif segmentType == SegmentType.ACK:
+            # In duplex mode, the sender ACKs the reply
+            if control.reply:
+                States.on_ack(control.reply, seqno, Stp.extract_rwnd(data))
+        elif segmentType in (SegmentType.DATA, SegmentType.DATA_ACK):
+            print('receieve DATA from sender')
+            print(seqno, buff.expct_seqno)
+            if segmentType == SegmentType.DATA_ACK:
+                ack, rwnd, data = Stp.extract_data_ack(data)
+            # Without a reply, no segment can carry the ACK
+            DelayedAck.on_data(control.ack_control, buff, control.writer, seqno, data, can_piggyback=control.reply is not None)
+
+            # The sender's ACK of the reply, which may open the window for more of it
+            if segmentType == SegmentType.DATA_ACK and control.reply:
+                States.on_ack(control.reply, ack, rwnd, is_pure=False)
+        elif segmentType == SegmentType.FEC:
+            # Rebuild the missing segment of this group, if it is the only one missing.
+            # ACK only if that happened: an ACK for every parity segment would look like a
+            # duplicate ACK to the sender.
+            if buff.insert_parity(seqno, *Fec.extract_parity(data)):
+                print(f'FEC recovered a segment in group {seqno}')
+                deliver(control, buff)
+                send_ack(control, buff, buff.expct_seqno)
 
+        # ACK now, unless a segment of the reply sent soon can carry the ACK
+        if control.reply:
+            DelayedAck.after_segment(control.ack_control, States.has_new_data(control.reply), control.reply.rto)
+        else:
+            DelayedAck.after_segment(control.ack_control, False, 0.0)
 
 if __name__ == "__main__":
-    if len(sys.argv) != NUM_ARGS + 1:
-        sys.exit(f"Usage: {sys.argv[0]} rcvr_port sender_port txt_file_received max_win")
+    if len(sys.argv) < NUM_ARGS + 1:
+        sys.exit(f"Usage: {sys.argv[0]} rcvr_port sender_port txt_file_received max_win [--fsync=none|close|batch] [--mss=bytes] [--reply=file_to_send_back]")
 
     # ================== Update arguments =====================
     rcvr_port = ArgParser.parse_port(sys.argv[1]) 
     sender_port = ArgParser.parse_port(sys.argv[2])
     txt_file_received = sys.argv[3]
     max_win = ArgParser.parse_max_win(sys.argv[4])
-    max_buff_size = max_win // MSS
-    # Open text file to write to
-    f = open(txt_file_received, 'w')
+    options = ArgParser.parse_options(sys.argv[NUM_ARGS + 1:], ('fsync', 'mss', 'reply'))
+    fsync_policy = ArgParser.parse_fsync(options.get('fsync', FsyncPolicy.NONE.value))
+    max_mss = ArgParser.parse_mss(options.get('mss', MAX_MSS))
+    reply_file = ArgParser.parse_file_name(options['reply']) if 'reply' in options else None
 
     # ================== Update socket setup =====================
     Helpers.reset_log('receiver')
     
+    control = None
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.bind(('127.0.0.1', rcvr_port))
         s.connect(('127.0.0.1', sender_port))
-        control = Control(rcvr_port, sender_port, txt_file_received, max_win, socket=s)
+        control = Control(rcvr_port, sender_port, txt_file_received, max_win, max_mss,
+                          transport=UdpTransport(s), clock=RealClock(), fsync_policy=fsync_policy,
+                          lock=threading.Lock(), on_closed=lambda: os._exit(os.EX_OK), reply_file=reply_file)
+        # Until the MSS is agreed, be ready for the largest segment we would agree to
+        control.buf_size = Stp.buf_size(min(max_mss, max_win))
         print('Receiver socket opened!')
         
-        is_first_segment = True
-        control.start_time = Helpers.get_time_mls()
+        control.start_time = control.clock.now()
         while control.is_alive:
-            receive = control.socket.recv(BUF_SIZE)
-            segmentType, seqno, data = Stp.extract_stp_segment(receive)
-            if is_first_segment:
-                is_first_segment = False
-                # First rcv message must always be a SYN segment
-                Helpers.log_message('receiver', LogActions.RECEIVE, 0.0, SegmentType.SYN, seqno, 0)
-            else:
-                Helpers.log_message('receiver', LogActions.RECEIVE, control.start_time, segmentType, seqno, 0 if not data else len(data))            
-
-
-            if segmentType == SegmentType.SYN:
-                print('receieve SYN from sender')
-                # For SYN segment, add 1 to seqno
-                seqno = Helpers.add_seqno(seqno, 1)
-
-                # Send back ACK segment
-                ack_segment = Stp.create_stp_segment(SegmentType.ACK, seqno)
-                s.send(ack_segment)
-
-                Helpers.log_message('receiver', LogActions.SEND, control.start_time, SegmentType.ACK, seqno, 0)
-
-                # Initialize buffer
-                buff = Buffer([None] * max_buff_size, seqno, 0, max_buff_size, LRU_Acked_Cache(max_buff_size * 2))
-            elif segmentType == SegmentType.FIN:
-                print('receive FIN from sender')
-                # For FIN segment, add 1 to seqno
-                seqno = Helpers.add_seqno(seqno, 1)
-
-                # Send back ACK segment
-                ack_segment = Stp.create_stp_segment(SegmentType.ACK, seqno)
-                s.send(ack_segment)
-
-                Helpers.log_message('receiver', LogActions.SEND, control.start_time, SegmentType.ACK, seqno, 0)
-
-                timer = threading.Timer(2 * MSL, timeout_thread, args=(control,))
-                timer.start()
-            elif segmentType == SegmentType.DATA:
-                # Need to handle negative MOD
-                print('receieve DATA from sender')
-                print(seqno, buff.expct_seqno)
-                # If in-order packet, place it to buffer[index]
-                if seqno == buff.expct_seqno:
-                    if buff.buffer[buff.index] != None: 
-                        raise Exception("buffer[index] is not empty")
-                    
-                    buff.buffer[buff.index] = data
-                    # Iterate thru buffer to write all in-order data
-                    while buff.buffer[buff.index] != None:
-                        buffered_rcv_data = buff.buffer[buff.index]
-                        buff.lru_seqno.add_seqno(buff.expct_seqno)
-                        
-                        current_seqno = (buff.expct_seqno + len(buffered_rcv_data)) % MAX_SEQNO
-
-                        f.write(buffered_rcv_data.decode())
-
-                        # Re-empty this position in buffer
-                        buff.buffer[buff.index] = None
-
-                        buff.expct_seqno = current_seqno
-                        buff.index = (buff.index + 1) % buff.max_size
-                elif not buff.lru_seqno.find(seqno):
-                    # If this is an out-of-order packet (by checking whether it exists in our lru cache), place it at somewhere with respect to 
-                    # the position of the expected in-order data
-                    
-                    # For example, we are expecting packet seqno = 1000 at index 1,
-                    # But receives packet seqno = 4000. 
-                    # Hence, we need to place this new packet at index = (4000-1000)/MSS + 1 (index) = 4
-                    
-                    # First, find the difference between the received seqno and the expected seqno.
-                    seqno_diff = seqno - buff.expct_seqno
-
-                    # Since sequence numbers are MOD-ED by 2^16, there are cases where seqno is smaller
-                    # than expected seqno, result in negative "seqno_diff"
-
-                    # In this case, we just need to add MAX_SEQNO to bump it up
-                    if seqno_diff < 0:
-                        # For example, expected seqno is 4000 at index 1.
-                        # But receives packet seqno = 1000.
-                        # Hence, seqno_diff = 1000 - 4000 = -3000. Then add MAX_SEQNO => seqno_diff = 2000.
-                        # Divide it by MSS, the index offset is 2, so the index for this packet seqno = 1000 is 3.
-                        # 0 1(expct) 2 3(new) 4
-                        #   4000       1000
-                        seqno_diff += MAX_SEQNO
-                    
-                    final_index = (buff.index + (seqno_diff // MSS)) % buff.max_size
-                    print(final_index)
-                    if buff.buffer[final_index] != None:
-                        raise Exception('buffer[final_index] is not empty')
-
-                    buff.buffer[final_index] = data
-                else:
-                    # Getting to this means that we received an already ACKED segment, so we don't do anything here
-                    pass
-
-                # Send back an ACK segment
-                ack_segment = Stp.create_stp_segment(SegmentType.ACK, buff.expct_seqno)
-                s.send(ack_segment)
-                Helpers.log_message('receiver', LogActions.SEND, control.start_time, SegmentType.ACK, buff.expct_seqno, 0)
+            handle_segment(control, s.recv(control.buf_size))
+    except OSError as e:
+        # The sender is gone, e.g. it was interrupted and the next recv() is refused. Close the
+        # writer first: it writes out what was received and takes the checkpoint to resume from.
+        print(f'Receiver socket error: {e}')
+        if control is not None:
+            with control.lock:
+                control.is_alive = False
+                stop_reply(control)
+                if control.writer is not None:
+                    try:
+                        control.writer.close()
+                    except (OSError, ValueError) as e:
+                        print(f'Could not write {control.output_file}: {e}')
+        os._exit(1)
     except Exception as e:
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+        # Do not wait for the writer thread, which runs until its close() that never comes
+        os._exit(1)
\ No newline at end of file
@@ -0,0 +1,233 @@
+import os
+import queue
+import threading
+import hashlib
+from src.enums import FsyncPolicy
+from src.receiver.checkpoint import Checkpoint, CHECKPOINT_INTERVAL
+
+MAX_IOV = 1024 # Maximum number of buffers coalesced into one write
+MAX_PATCH_WRITE = 2**22 # Bytes of a rebuilt file written at once in delta mode
+
+class DiskWriter:
+    '''
+        Write-behind stage of the receiver.
+
+        The packet loop hands in-order runs of data to submit() and goes straight back to the
+        network. A dedicated thread drains the bounded queue, coalesces every run that is
+        already waiting into one binary write (os.pwritev where available) and applies the
+        fsync policy.
+
+        "backlog" is the number of bytes submitted but not yet written. The receiver takes it away
+        from its advertised window, so a slow disk slows the sender down instead of overflowing
+        the receiver.
+
+        The writer also hashes everything it writes, and every CHECKPOINT_INTERVAL bytes records
+        the offset and digest in a checkpoint next to the file, so an interrupted transfer can
+        be resumed.
+
+        If a write fails (e.g. the disk is full), the thread keeps the error and throws away
+        whatever is queued after it, so the packet loop never blocks on a full queue. The next
+        submit() or close() raises the error.
+
+        In delta mode the runs are instructions rather than data. The thread rebuilds the file
+        from them with the patcher, so reading the copied blocks from the old file never holds
+        up the packet loop. "backlog" then counts instruction bytes, which is what the window
+        holds. The new file is written under a temporary name, and only renamed over the old
+        one once it is complete: until then, the old file is what the new one is rebuilt from.
+    '''
+    def __init__(self, file_name: str, fsync_policy: FsyncPolicy, max_queue_size: int, on_drain=None,
+                 offset: int = 0, prefix_hash=None, final_name: str = None, patcher=None) -> None:
+        '''
+            Args:
+                file_name       (str): name of output file, truncated to offset on open
+                fsync_policy    (FsyncPolicy): when to fsync the output file
+                max_queue_size  (int): maximum number of runs waiting to be written
+                on_drain        (callable, optional): called from the writer thread every time the
+                queue has been emptied
+                offset          (int, optional): number of bytes of the file kept, when resuming
+                prefix_hash     (optional): sha256 hash object of those bytes, from Checkpoint.load()
+                final_name      (str, optional): name to rename the file to once it is complete.
+                An incomplete file is removed instead.
+                patcher         (DeltaPatcher, optional): in delta mode, rebuilds the file from the
+                instructions submitted
+        '''
+        self.file_name = file_name
+        self.fd = os.open(file_name, os.O_WRONLY | os.O_CREAT, 0o644)
+        # Drop whatever was written after the checkpoint, or the whole file when not resuming
+        os.ftruncate(self.fd, offset)
+        # Without pwritev, writes go to the current position: start it after the bytes kept
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        if offset == 0:
+            Checkpoint.remove(file_name)
+        self.fsync_policy = fsync_policy
+        self.on_drain = on_drain
+        self.queue: queue.Queue[bytes] = queue.Queue(max_queue_size)
+        self.offset = offset    # File offset of the next write
+        self.backlog = 0    # Bytes submitted but not yet written
+        self.lock = threading.Lock()
+        self.hash = prefix_hash or hashlib.sha256()  # Digest of the file up to offset
+        self.checkpoint_offset = offset     # Offset of the latest checkpoint
+        self.is_complete = False    # Whether the whole file has been received, set by close()
+        self.final_name = final_name
+        self.patcher = patcher
+        self.error: Exception = None    # Error a write failed with, raised by submit() and close()
+
+        self.thread = threading.Thread(target=self.write_thread)
+        self.thread.start()
+
+    def submit(self, data: bytes) -> None:
+        '''
+            Queue an in-order run of data to be written.
+
+            Args:
+                data (bytes): received data, in order
+            Raises:
+                OSError: if an earlier write failed, ValueError if an instruction was invalid
+        '''
+        if self.error: raise self.error
+        if not data: return
+        with self.lock:
+            self.backlog += len(data)
+        self.queue.put(data)
+
+    def close(self, is_complete: bool = False) -> None:
+        '''
+            Write everything still queued, fsync if the policy asks for it and close the file.
+
+            Args:
+                is_complete (bool, optional): whether the transfer finished, then the checkpoint is
+                removed. Otherwise a last one is taken, to resume from.
+            Raises:
+                OSError: if a write failed, ValueError if an instruction was invalid
+        '''
+        self.is_complete = is_complete
+        self.queue.put(None)
+        self.thread.join()
+        if self.error: raise self.error
+
+    def write_thread(self) -> None:
+        is_closing = False
+        try:
+            while not is_closing:
+                runs = [self.queue.get()]
+                # Coalesce whatever else is already waiting into the same write
+                while len(runs) < MAX_IOV:
+                    try:
+                        runs.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                # None is queued by close(), always last
+                if runs[-1] is None:
+                    is_closing = True
+                    runs.pop()
+
+                if runs:
+                    submitted = sum(len(run) for run in runs)
+                    if self.patcher:
+                        self.write_patched(runs)
+                    else:
+                        self.write_runs(runs)
+
+                    with self.lock:
+                        self.backlog -= submitted
+                    if self.on_drain and self.queue.empty():
+                        self.on_drain()
+
+            if self.fsync_policy != FsyncPolicy.NONE:
+                os.fsync(self.fd)
+        except (OSError, ValueError) as e:
+            # ValueError: the patcher found an invalid instruction
+            print(f'Write to {self.file_name} failed: {e}')
+            self.error = e
+            # Keep taking runs off the queue until close(), so submit() never waits on it forever
+            while not is_closing:
+                is_closing = self.queue.get() is None
+        os.close(self.fd)
+
+        if self.error:
+            # Keep the latest checkpoint, it still matches the start of the file
+            if self.final_name:
+                Checkpoint.remove(self.file_name)
+                os.remove(self.file_name)
+        elif self.is_complete:
+            Checkpoint.remove(self.file_name)
+            if self.final_name:
+                os.replace(self.file_name, self.final_name)
+        elif self.final_name:
+            # Leave the old file as it was
+            Checkpoint.remove(self.file_name)
+            os.remove(self.file_name)
+        elif self.offset != self.checkpoint_offset:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        Checkpoint.save(self.file_name, self.offset, self.hash.digest())
+        self.checkpoint_offset = self.offset
+
+    def write_runs(self, runs: list[bytes]) -> None:
+        '''
+            Write contiguous runs at the current file offset in one system call.
+
+            Args:
+                runs (list[bytes]): in-order runs of data
+        '''
+        total = sum(len(run) for run in runs)
+
+        if hasattr(os, 'pwritev'):
+            written = os.pwritev(self.fd, runs, self.offset)
+        else:
+            written = os.write(self.fd, b''.join(runs))
+        # A write may be short, write out the rest
+        if written < total:
+            rest = memoryview(b''.join(runs))[written:]
+            while rest:
+                n = os.pwrite(self.fd, rest, self.offset + written) if hasattr(os, 'pwrite') else os.write(self.fd, rest)
+                written += n
+                rest = rest[n:]
+
+        self.offset += total
+        if self.fsync_policy == FsyncPolicy.BATCH:
+            os.fsync(self.fd)
+
+        for run in runs:
+            self.hash.update(run)
+        if self.offset - self.checkpoint_offset >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def write_patched(self, runs: list[bytes]) -> None:
+        '''
+            Rebuild the next part of the file from a run of delta instructions and write it, at
+            most MAX_PATCH_WRITE bytes at a time, however many blocks an instruction copies.
+
+            Args:
+                runs (list[bytes]): in-order runs of instructions
+        '''
+        batch, size = [], 0
+        for run in self.patcher.feed(b''.join(runs)):
+            batch.append(run)
+            size += len(run)
+            if size >= MAX_PATCH_WRITE or len(batch) == MAX_IOV:
+                self.write_runs(batch)
+                batch, size = [], 0
+        if batch:
+            self.write_runs(batch)
+
+class MemoryWriter:
+    '''
+        Stands in for DiskWriter when the data is wanted in memory: the signatures the sender
+        receives in delta mode. Data is kept at once, so
+        there is never a backlog. It takes the arguments of DiskWriter, but never resumes.
+    '''
+    def __init__(self, *args, **kwargs) -> None:
+        self.runs: list[bytes] = []
+        self.backlog = 0
+
+    def submit(self, data: bytes) -> None:
+        if data: self.runs.append(bytes(data))
+
+    def close(self, is_complete: bool = False) -> None:
+        pass
+
+    def getvalue(self) -> bytes:
+        return b''.join(self.runs)
@@ -0,0 +1,128 @@
+from array import array
+
+MAX_SEQNO = 2**16 # Maximum sequence number
+
+class Scoreboard:
+    '''
+        Circular scoreboard of in-flight segments for the sender, sized to the window.
+
+        Each slot holds the length, send time and retransmit count of one segment.
+        Slots are used in send order starting at "head", so the slot of a seqno is found by
+        modular arithmetic on its offset from base_seqno (the oldest unACKed seqno).
+
+        Every segment but the last one of the file is exactly MSS bytes, so that offset is
+        always a multiple of MSS.
+    '''
+    __slots__ = ('mss', 'num_slots', 'lengths', 'send_times', 'retrans', 'head', 'count', 'base_seqno',
+                 'next_seqno', 'inflight_bytes', 'last_rtt', 'total_sent', 'total_retrans', 'total_lost',
+                 'total_retrans_segments')
+
+    def __init__(self, max_win: int, mss: int, isn: int) -> None:
+        '''
+            Args:
+                max_win (int): maximum window size in bytes
+                mss     (int): maximum segment size in bytes
+                isn     (int): sequence number of the first data segment
+        '''
+        self.mss = mss
+        self.num_slots = max(1, max_win // mss)
+        self.lengths = array('I', [0]) * self.num_slots
+        self.send_times = array('d', [0.0]) * self.num_slots
+        self.retrans = array('I', [0]) * self.num_slots
+        self.head = 0           # The slot of the oldest unACKed segment
+        self.count = 0          # Number of segments in flight
+        self.base_seqno = isn   # The oldest unACKed seqno
+        self.next_seqno = isn   # The seqno of the next new segment
+        self.inflight_bytes = 0
+        self.last_rtt = None    # Latest RTT sample in miliseconds, None until the first one
+        self.total_sent = 0     # Number of new segments sent
+        self.total_retrans = 0  # Number of retransmissions
+        self.total_lost = 0     # Number of retransmissions for a loss, a timeout or a third duplicate ACK
+        self.total_retrans_segments = 0 # Number of ACKed segments that needed at least one retransmission
+
+    def can_send(self, length: int, window: int) -> bool:
+        '''
+            Args:
+                length (int): payload size of the next new segment
+                window (int): current send window in bytes
+            Returns:
+                bool: True if a new segment of this length fits in both the window and the scoreboard
+        '''
+        return self.count < self.num_slots and self.inflight_bytes + length <= window
+
+    def lookup(self, seqno: int) -> int:
+        '''
+            Args:
+                seqno (int): sequence number of a segment
+            Returns:
+                int: how many segments this seqno is after base_seqno, or -1 if it is not in flight
+        '''
+        offset = (seqno - self.base_seqno) % MAX_SEQNO
+        if offset >= self.inflight_bytes:
+            return -1
+        return offset // self.mss
+
+    def on_send(self, seqno: int, length: int, now: float, is_loss: bool = False) -> None:
+        '''
+            Record a sent segment. A seqno equals to next_seqno is a new segment and takes the
+            next free slot (the caller must check can_send() first), anything else is a retransmission.
+
+            Args:
+                seqno   (int): sequence number of the segment
+                length  (int): payload size
+                now     (float): send time in miliseconds
+                is_loss (bool, optional): whether a retransmission is for a loss, rather than a
+                zero window probe or a segment the receiver dropped for lack of room
+        '''
+        if seqno == self.next_seqno and self.count < self.num_slots:
+            slot = (self.head + self.count) % self.num_slots
+            self.lengths[slot] = length
+            self.send_times[slot] = now
+            self.retrans[slot] = 0
+
+            self.count += 1
+            self.inflight_bytes += length
+            self.next_seqno = (self.next_seqno + length) % MAX_SEQNO
+            self.total_sent += 1
+            return
+
+        offset = self.lookup(seqno)
+        if offset < 0:
+            return
+        slot = (self.head + offset) % self.num_slots
+        self.retrans[slot] += 1
+        self.send_times[slot] = now
+        self.total_retrans += 1
+        if is_loss: self.total_lost += 1
+
+    def on_ack(self, ack_seqno: int, now: float) -> int:
+        '''
+            Process a cumulative ACK: free every slot it covers and take an RTT sample from the
+            newest covered segment that was never retransmitted (Karn's algorithm).
+
+            Args:
+                ack_seqno   (int): the next seqno the receiver expects
+                now         (float): receive time in miliseconds
+            Returns:
+                int: number of newly ACKed segments, 0 for a duplicate or an old ACK
+        '''
+        acked_bytes = (ack_seqno - self.base_seqno) % MAX_SEQNO
+        if acked_bytes == 0 or acked_bytes > self.inflight_bytes:
+            return 0
+
+        acked_cnt = 0
+        while self.count > 0 and self.lengths[self.head] <= acked_bytes:
+            slot = self.head
+            acked_bytes -= self.lengths[slot]
+            self.inflight_bytes -= self.lengths[slot]
+            if self.retrans[slot] == 0:
+                self.last_rtt = now - self.send_times[slot]
+            else:
+                self.total_retrans_segments += 1
+
+            self.head = (self.head + 1) % self.num_slots
+            self.count -= 1
+            acked_cnt += 1
+
+        self.base_seqno = (ack_seqno - acked_bytes) % MAX_SEQNO
+        return acked_cnt
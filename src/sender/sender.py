@@ -17,7 +17,8 @@ from dataclasses import dataclass
 from src.helpers.arg_parser import ArgParser
 from src.helpers.helpers import Helpers
 from src.sender.states import States
-from src.helpers.stp_helpers import Stp
+from src.helpers.stp_helpers import Stp, DEFAULT_MSS
+from src.helpers.runtime import RealClock, UdpTransport
 from src.sender.sender_prototypes import NUM_ARGS, MAX_SEQNO, Control
 
 # =====================Update setup_socket function ========================
@@ -28,8 +29,8 @@ def setup_socket(sender_port):
     return sock
 
 if __name__ == "__main__":
-    if len(sys.argv) != NUM_ARGS + 1:
-        sys.exit(f"Usage: {sys.argv[0]} sender_port rcvr_port txt_file_to_send max_win rto flp rlp")
+    if len(sys.argv) < NUM_ARGS + 1:
+        sys.exit(f"Usage: {sys.argv[0]} sender_port rcvr_port txt_file_to_send max_win rto flp rlp [--mss=bytes] [--fec=segments|auto] [--resume] [--reply=file_to_save_reply] [--fast-open] [--delta]")
 
     sender_port   = ArgParser.parse_port(sys.argv[1])
     rcvr_port = ArgParser.parse_port(sys.argv[2])
@@ -38,10 +39,31 @@ if __name__ == "__main__":
     rto = ArgParser.parse_rto(sys.argv[5])
     flp = ArgParser.parse_prop(sys.argv[6])
     rlp = ArgParser.parse_prop(sys.argv[7])
+    options = ArgParser.parse_options(sys.argv[NUM_ARGS + 1:], ('mss', 'fec', 'resume', 'reply', 'fast-open', 'delta'))
+    mss = ArgParser.parse_mss(options.get('mss', DEFAULT_MSS))
+    fec_group, fec_adaptive = ArgParser.parse_fec(options['fec']) if 'fec' in options else (0, False)
+    is_resume = ArgParser.parse_flag(options.get('resume', 'false'))
+    # In duplex mode the receiver sends a file back, which we save here
+    reply_file = options.get('reply')
+    is_fast_open = ArgParser.parse_flag(options.get('fast-open', 'false'))
+    is_delta = ArgParser.parse_flag(options.get('delta', 'false'))
+    if max_win < mss:
+        sys.exit(f"Invalid max_win, must hold at least one segment of {mss} bytes: {max_win}")
+    # Data sent with the SYN starts the file, while where a resumed transfer starts is only known from the SYN ACK
+    if is_fast_open and is_resume:
+        sys.exit("--fast-open cannot be used with --resume")
+    # The delta is only known once the receiver's signatures are in, and they come as the reply
+    if is_delta and (is_resume or is_fast_open or reply_file):
+        sys.exit("--delta cannot be used with --resume, --fast-open or --reply")
 
     Helpers.reset_log('sender')
 
     sock = setup_socket(sender_port)
+    try:
+        # Establish a connected UDP connection
+        sock.connect(('127.0.0.1', rcvr_port))
+    except Exception as e:
+        sys.exit(f"Failed to connect to '127.0.0.1':{rcvr_port}: {e}")
 
     random.seed()  # Seed the random number generator
     isn = random.randrange(MAX_SEQNO)
@@ -49,16 +71,20 @@ if __name__ == "__main__":
 
     # Create a control block for the sender program.
     control = Control(sender_port=sender_port, rcvr_port=rcvr_port, 
-                      socket=sock, max_win=max_win, seqno=isn, rto=rto,
-                      file_name=txt_file_to_send, flp=flp, rlp=rlp, lock=threading.Lock())
-    States.state_syn_sent(control)
-    print('Finished 2-way Connection Setup')
+                      transport=UdpTransport(sock), clock=RealClock(), max_win=max_win, seqno=isn, rto=rto,
+                      file_name=txt_file_to_send, flp=flp, rlp=rlp, lock=threading.Lock(), mss=mss,
+                      fec_group=fec_group, fec_adaptive=fec_adaptive, is_resume=is_resume,
+                      reply_file=reply_file, is_fast_open=is_fast_open,
+                      is_delta=is_delta)
+    with control.lock:
+        States.state_syn_sent(control)
 
-    States.state_est(control)
-    print('Finished Sending Data Reliably')
+    # Hand every segment from the receiver to the state machine until the FIN is ACKed.
+    # Timeouts are handled on the timer threads of the clock.
+    while not control.is_closed:
+        States.on_segment(control, sock.recv(control.buf_size))
 
-    States.state_closing(control)
-    control.socket.close()  # Close the socket
+    control.transport.close()  # Close the socket
 
     print("Shut down complete.")
 
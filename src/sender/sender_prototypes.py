@@ -1,40 +1,70 @@
-import socket
 import threading
 from dataclasses import dataclass
+from src.sender.scoreboard import Scoreboard
+from src.helpers.stp_helpers import HEADER_SIZE, EXTRA_SIZE, DEFAULT_MSS
+from src.helpers.fec import FecEncoder
+from src.helpers.runtime import Transport, Clock
 
 NUM_ARGS  = 7  # Number of command-line arguments
-BUF_SIZE  = 4  # Size of buffer for receiving messages
+BUF_SIZE  = HEADER_SIZE + EXTRA_SIZE  # Size of buffer for receiving messages (ACK header, window and options)
 MAX_SEQNO = 2**16 # Maximum sequence number
-MSS = 1000     # Maximum segment size
+@dataclass 
+class SegmentControl:
+    """Segment Control block: manages data segments related info"""
+    segments: list[bytes]       # List of MSS bytes max segments from file
+    scoreboard: Scoreboard      # Length, send time and retransmit count of in-flight segments
+    send_base: int = 0  # The index of the oldest unACKed segment
+    next_index: int = 0 # The index of the next new segment
+    dupACK_cnt: int = 0 # The count of duplicate ACKed segment for fast retransmit 
+    fec: FecEncoder = None  # Parity of the current group of new segments, None without FEC
+    num_received: int = 0   # Data segments the receiver reported to have received, with FEC
+
+@dataclass
+class ReplyControl:
+    """Reply control block: the data the other side sends back in duplex mode"""
+    buff: object            # ReassemblyWindow for the reply
+    writer: object          # DiskWriter of the reply file
+    ack_control: object     # AckControl, when to ACK the reply
+    is_done: bool = False   # whether the FIN ending the reply has arrived
+
 @dataclass
 class Control:
     """Control block: parameters for the sender program."""
     # ================== Update arguments =====================
     sender_port: int    # Port number of the sender
     rcvr_port: int      # Port number of the receiver
-    max_win: int        # max window size, should be the same for receiver side
+    max_win: int        # max window size, the sender never has more than this in flight
     rto: float          # retransmission time for a socket
     seqno: int          # sequence number of sender socket
     file_name: str      # name of file being sent
     rlp: float          # probability of incoming packet being dropped
     flp: float          # probability of sent packet being dropped
-    socket: socket.socket   # Socket for sending/receiving messages
+    transport: Transport    # Sends segments, a connected UDP socket or the simulated network
+    clock: Clock            # Time and timers, real or virtual
     is_connected: bool = False # a flag to signal successful connection or when to terminate
     is_est_state: bool = False # a flag to signal whether our sender program is in EST state
+    is_closed: bool = False    # a flag to signal the FIN has been ACKed
     start_time: float = 0.0   # time in miliseconds at first sent segment
-    timer: threading.Timer = None # A single timer associates with the EST state
-    lock: threading.Lock = None # lock for timer 
-
-@dataclass
-class Segment:
-    is_sent: bool
-    data: bytes
-
-@dataclass 
-class SegmentControl:
-    """Segment Control block: manages data segments related info"""
-    segments: list[Segment]      # List of 1000 bytes max segments from file
-    send_base: int = 0  # The index of the oldest unACKed segment
-    end: int = 0        # The end index of current sliding window on segments[]
-    seqno_map: dict[int, int] = None # A dictionary to map seqno to its corresponding index in list
-    dupACK_cnt: int = 0 # The count of duplicate ACKed segment for fast retransmit 
+    end_time: float = 0.0     # time in miliseconds at which the FIN was ACKed
+    timer: object = None    # The single retransmission timer, from clock.call_later()
+    lock: threading.Lock = None # held by every event handler, segments and timeouts never run at once
+    segment_control: SegmentControl = None  # data segments, created on entering EST state
+    rwnd: int = 0       # window advertised by the receiver in its latest ACK
+    mss: int = DEFAULT_MSS  # maximum segment size, proposed in the SYN then agreed in the SYN ACK
+    fec_group: int = 0  # number of data segments per parity segment, 0 to disable FEC
+    fec_adaptive: bool = False # whether fec_group follows the observed loss rate
+    is_resume: bool = False # whether to ask the receiver to resume from its checkpoint
+    offset: int = 0     # file offset the transfer starts at, non zero when resuming
+    reply_file: str = None  # where to write the receiver's reply, asks for duplex mode when set
+    reply: ReplyControl = None  # the reply, once the receiver agreed to duplex mode
+    writer_class: type = None   # Class of the reply writer, DiskWriter when None
+    piggyback: callable = None  # in duplex mode, returns the ACK and window data segments carry
+    buf_size: int = BUF_SIZE    # Size of buffer for receiving segments, room for data in duplex mode
+    user: str = 'sender'    # which log file this side writes, the receiver's reply logs to its own
+    is_fast_open: bool = False  # whether to send the first window with the SYN, before the SYN ACK
+    syn_seqno: int = 0  # seqno of our SYN
+    early_ack: tuple = None # (seqno, rwnd) of the latest ACK of 0-RTT data that overtook the SYN ACK
+    is_delta: bool = False  # whether to ask for delta mode, sending only what the receiver's copy lacks
+    block_size: int = 0     # block size the receiver chose in delta mode, 0 otherwise
+    payload: bytes = None   # data to send instead of the file: the delta, or the receiver's signatures
+    early_reply: list = None    # (seqno, data) of reply segments that overtook the SYN ACK
@@ -1,80 +1,210 @@
-import sys
-import threading
-from src.sender.sender_prototypes import Control, SegmentControl, BUF_SIZE, MSS
+from src.sender.sender_prototypes import Control, SegmentControl, ReplyControl, MAX_SEQNO
+from src.helpers.stp_helpers import DEFAULT_MSS
+from src.helpers.fec import FecEncoder, MAX_FEC_GROUP
 from src.helpers.stp_helpers import Stp
-from src.enums import SegmentType, LogActions
+from src.enums import SegmentType, LogActions, SynOption, FsyncPolicy
 from src.helpers.helpers import Helpers
+from src.receiver.reassembly import ReassemblyWindow
+from src.receiver.delayed_ack import AckControl, DelayedAck
+from src.receiver.writer import DiskWriter, MemoryWriter
+from src.helpers.delta import Delta
+
+# The sender is a state machine driven by two kinds of events: a segment from the receiver,
+# handed to States.on_segment(), and a timeout set on control.clock. Every handler runs with
+# control.lock held, and nothing here blocks or sleeps, so the same code runs on a UDP socket
+# with real timers (sender.py) or on a simulated network with a virtual clock (simulator.py).
+#
+# In duplex mode the receiver sends a reply back on the same connection. It runs its own copy of
+# the EST and CLOSING handlers for the reply, and both sides ACK the other direction on the data
+# segments they send (DATA_ACK). Both sides take in the other direction with the same handlers,
+# in src/receiver/delayed_ack.py.
 
 class States:
+    @staticmethod
+    def on_segment(control: Control, segment: bytes):
+        '''
+            Entry point for every segment from the receiver, handled by the current state.
+
+            Args:
+                control (Control): The control block for the sender program.
+                segment (bytes): the received STP segment
+        '''
+        with control.lock:
+            if control.is_closed:
+                return
+            segtype, seqno, data = Stp.extract_stp_segment(segment)
+
+            if Helpers.is_dropped(control.rlp):
+                Helpers.log_message(control.user, LogActions.DROPPED, control.start_time, segtype, seqno, 0)
+                return
+
+            Helpers.log_message(control.user, LogActions.RECEIVE, control.start_time, segtype, seqno, 0)
+
+            reply = control.reply
+            if not control.is_connected:
+                SynSent_Handlers.on_segment(control, segtype, seqno, data)
+                reply = control.reply
+            elif segtype == SegmentType.ACK:
+                if control.fec_group and control.segment_control:
+                    States.on_received_report(control.segment_control, Stp.extract_ack_options(data))
+                States.on_ack(control, seqno, Stp.extract_rwnd(data))
+            elif reply and segtype == SegmentType.DATA_ACK:
+                # Take in the reply data first, so whatever we send next ACKs it
+                ack, rwnd, data = Stp.extract_data_ack(data)
+                Reply_Handlers.on_data(control, seqno, data)
+                States.on_ack(control, ack, rwnd, is_pure=False)
+            elif reply and segtype == SegmentType.FIN:
+                Reply_Handlers.on_fin(control, seqno)
+
+            # ACK the reply now, unless a data segment we send soon can carry the ACK
+            if reply:
+                DelayedAck.after_segment(reply.ack_control, States.has_new_data(control), control.rto)
+
+    @staticmethod
+    def on_ack(control: Control, seqno: int, rwnd: int, is_pure: bool = True):
+        '''
+            Hand an ACK for our data to the current state, once connected.
+
+            Args:
+                control (Control): The control block for the sender program.
+                seqno   (int): the next seqno the other side expects
+                rwnd    (int): the window it advertised
+                is_pure (bool, optional): False when the ACK came on a data segment
+        '''
+        if control.is_est_state:
+            Est_Handlers.on_ack(control, control.segment_control, seqno, rwnd, is_pure)
+        elif not control.is_closed:
+            Closing_Handlers.on_ack(control, seqno)
+
+    @staticmethod
+    def on_received_report(segment_control: SegmentControl, options: dict):
+        '''
+            With FEC, the receiver's ACKs report how many data segments have arrived so far.
+            ACKs may arrive out of order, keep the highest count.
+        '''
+        if SynOption.RECEIVED in options:
+            segment_control.num_received = max(segment_control.num_received, int.from_bytes(options[SynOption.RECEIVED], 'big'))
+
+    @staticmethod
+    def has_new_data(control: Control) -> bool:
+        '''
+            Returns:
+                bool: whether new data segments are still to be sent, which can carry an ACK
+        '''
+        segment_control = control.segment_control
+        return (control.is_est_state and segment_control is not None
+                and segment_control.next_index < len(segment_control.segments))
+
     @staticmethod
     def state_syn_sent(control: Control):
         '''
         Enter SYN_SENT state by first sending an SYN segment, waiting for ACK from receiver.
         '''
-        try:
-            # Establish a connected UDP connection
-            control.socket.connect(('127.0.0.1', control.rcvr_port))
-            
-            # Create a STP segment
-            stp_segment = Stp.create_stp_segment(segtype=SegmentType.SYN, seqno=control.seqno)
-            
-            receive_thread = threading.Thread(target=SynSent_Threads.recv_thread, args=(control,))
-            receive_thread.start()
-
-            control.start_time = Helpers.get_time_mls()
-            control.timer = threading.Timer(control.rto, SynSent_Threads.timeout_thread, (control, stp_segment))
-            control.timer.start()
-
-            if Helpers.is_dropped(control.flp):
-                Helpers.log_message('sender', LogActions.DROPPED, 0.0, SegmentType.SYN, control.seqno, 0)
-            else:
-                Helpers.log_message('sender', LogActions.SEND, 0.0, SegmentType.SYN, control.seqno, 0)
-                control.socket.send(stp_segment)
-            
-            receive_thread.join()
+        # Create a STP segment, proposing our MSS. With FEC, tell the receiver the largest group
+        # so it keeps enough delivered segments around to repair one.
+        options = {SynOption.MSS: control.mss.to_bytes(2, byteorder="big")}
+        if control.fec_group:
+            options[SynOption.FEC] = bytes([MAX_FEC_GROUP if control.fec_adaptive else control.fec_group])
+        if control.is_resume:
+            options[SynOption.RESUME] = b''
+        # Ask for a reply, telling the receiver how much of it we take at once and our RTO to send it with.
+        # In delta mode, the reply is the signatures of the receiver's copy.
+        if control.is_delta:
+            options[SynOption.DELTA] = b''
+        if control.reply_file or control.is_delta:
+            options[SynOption.DUPLEX] = control.max_win.to_bytes(4, byteorder="big") + round(control.rto * 1000).to_bytes(4, byteorder="big")
+            # The reply may start before the SYN ACK arrives, and is split with an MSS no larger
+            # than ours. Read whole segments of it from now on, not just ACKs.
+            control.buf_size = Stp.buf_size(control.mss)
+        # 0-RTT: split the file with the MSS we propose and put the first segment in the SYN.
+        # The receiver only keeps it if it agrees to that MSS.
+        early_data = b''
+        if control.is_fast_open:
+            States.create_segment_control(control, Helpers.add_seqno(control.seqno, 1))
+            if control.segment_control.segments:
+                early_data = control.segment_control.segments[0]
+                options[SynOption.FAST_OPEN] = early_data
+        options = Stp.create_options(options)
+        stp_segment = Stp.create_stp_segment(segtype=SegmentType.SYN, seqno=control.seqno, data=options)
+
+        control.syn_seqno = control.seqno
+        control.start_time = control.clock.now()
+        control.timer = control.clock.call_later(control.rto, SynSent_Handlers.on_timeout, (control, stp_segment))
+
+        send_non_data(control, SegmentType.SYN, stp_segment, 0.0)
+
+        if early_data:
+            segment_control = control.segment_control
+            control.seqno = Helpers.add_seqno(control.seqno, 1)
+            segment_control.scoreboard.on_send(control.seqno, len(early_data), control.start_time)
+            segment_control.next_index = 1
+            control.seqno = Helpers.add_seqno(control.seqno, len(early_data))
+
+            # Send the rest of the first window right behind the SYN. Until the receiver advertises
+            # its window, take it to be as large as ours. These segments get their retransmission
+            # timer once the connection is set up.
+            control.rwnd = control.max_win
+            Est_Handlers.fill_window(control, segment_control)
 
-            control.timer.cancel()
-            control.timer = None
-        except Exception as e:
-            sys.exit(f"Failed to connect to '127.0.0.1':{control.rcvr_port}: {e}")
+    @staticmethod
+    def create_segment_control(control: Control, seqno: int):
+        '''
+            Split the file, or control.payload when set, into segments of control.mss bytes,
+            the first one starting at seqno.
+        '''
+        if control.payload is not None:
+            segment_control = Helpers.create_segment_control_from_bytes(control.payload, seqno, control.max_win, control.mss)
+        else:
+            if control.offset:
+                print(f'Resuming from byte {control.offset}')
+            segment_control = Helpers.create_segment_control(control.file_name, seqno, control.max_win, control.mss, control.offset)
+        if control.fec_group:
+            segment_control.fec = FecEncoder(control.fec_group, control.fec_adaptive)
+        control.segment_control = segment_control
 
     @staticmethod
     def state_est(control: Control):
+        print('Finished 2-way Connection Setup')
         control.is_est_state = True
 
-        segment_control = Helpers.create_segment_control(control.file_name, control.seqno)
+        # Unless the first window already went out with the SYN
+        if control.segment_control is None:
+            States.create_segment_control(control, control.seqno)
+        segment_control = control.segment_control
+
+        # An empty file has nothing to wait for
+        if Est_Handlers.is_finished(control, segment_control):
+            States.state_closing(control)
+            return
 
-        # Start the receiver and sender threads.
-        send = threading.Thread(target=Est_Threads.send_thread, args=(control, segment_control,))
-        send.start()
+        if segment_control.scoreboard.count > 0:
+            seqno = segment_control.scoreboard.base_seqno
+            print(f'put timer on {seqno}')
+            control.timer = control.clock.call_later(control.rto, Est_Handlers.on_timeout, (control, segment_control, seqno))
 
-        receiver = threading.Thread(target=Est_Threads.recv_thread, args=(control, segment_control))
-        receiver.start()
+        Est_Handlers.fill_window(control, segment_control)
 
-        # Suspend execution here and wait for the threads to finish.
-        receiver.join()
-        send.join()
-        # timer.cancel()
-    
     @staticmethod
     def state_closing(control: Control):
-        stp_segment = Stp.create_stp_segment(segtype=SegmentType.FIN, seqno=control.seqno)
+        control.is_est_state = False
 
-        receiver = threading.Thread(target=Closing_Threads.receive_thread, args=(control,))
-        receiver.start()
+        scoreboard = control.segment_control.scoreboard
+        print(f'Sent {scoreboard.total_sent} segments, retransmitted {scoreboard.total_retrans} '
+              f'for {scoreboard.total_retrans_segments} of them')
+        if scoreboard.last_rtt is not None:
+            print(f'Latest RTT sample {scoreboard.last_rtt:.2f} ms')
+        if control.segment_control.fec:
+            print(f'FEC group size {control.segment_control.fec.group_size}')
+        print('Finished Sending Data Reliably')
 
-        # Start sending FIN segments
-        control.timer = threading.Timer(control.rto, Closing_Threads.timeout_thread, (control, stp_segment))
-        control.timer.start()
-        
-        send_non_data(control, SegmentType.FIN, stp_segment, control.start_time)
+        stp_segment = Stp.create_stp_segment(segtype=SegmentType.FIN, seqno=control.seqno)
 
-        receiver.join()
+        # Start sending FIN segments
+        control.timer = control.clock.call_later(control.rto, Closing_Handlers.on_timeout, (control, stp_segment))
 
-        control.timer.cancel()
-        control.timer = None
+        send_non_data(control, SegmentType.FIN, stp_segment, control.start_time)
 
-def send_data(control: Control, segment_control: SegmentControl, data_seqno: int, data: bytes):
+def send_data(control: Control, segment_control: SegmentControl, data_seqno: int, data: bytes, is_loss: bool = False):
     '''
         Send data to receiver, initiate timer if haven't already.
 
@@ -83,197 +213,375 @@ def send_data(control: Control, segment_control: SegmentControl, data_seqno: int
             segment_control (SegmentControl): The control block for data segments.
             data_seqno  (int): sequence number of the data we wanna send
             data        (bytes): payload
+            is_loss     (bool, optional): whether this is a retransmission for a loss
     '''
-    sent_segment = Stp.create_stp_segment(SegmentType.DATA, data_seqno, data)
-
-    control.lock.acquire()
+    if control.piggyback:
+        # Duplex mode: ACK the other direction on the same segment
+        sent_segment = Stp.create_data_ack_segment(data_seqno, *control.piggyback(), data)
+    else:
+        sent_segment = Stp.create_stp_segment(SegmentType.DATA, data_seqno, data)
 
     if control.timer == None:
         print(f'put timer on {data_seqno}')
-        control.timer = threading.Timer(control.rto, Est_Threads.timeout_thread, args=(control, segment_control, data_seqno))
-        control.timer.start()
-    control.lock.release()
+        control.timer = control.clock.call_later(control.rto, Est_Handlers.on_timeout, (control, segment_control, data_seqno))
+    # Record the segment before it goes out, so its ACK always finds it on the scoreboard
+    segment_control.scoreboard.on_send(data_seqno, len(data), control.clock.now(), is_loss)
+
+    if Helpers.is_dropped(control.flp):
+        Helpers.log_message(control.user, LogActions.DROPPED, control.start_time, SegmentType.DATA, data_seqno, len(data))
+    else:
+        Helpers.log_message(control.user, LogActions.SEND, control.start_time, SegmentType.DATA, data_seqno, len(data))
+        control.transport.send(sent_segment)
+
+def send_fec(control: Control, first_seqno: int, segment: bytes):
+    '''
+        Send a parity segment. It is never retransmitted nor ACKed.
 
+        Args:
+            control (Control): The control block for the sender program.
+            first_seqno (int): sequence number of the first data segment of the group
+            segment (bytes): the FEC segment
+    '''
     if Helpers.is_dropped(control.flp):
-        Helpers.log_message('sender', LogActions.DROPPED, control.start_time, SegmentType.DATA, data_seqno, len(data))
+        Helpers.log_message(control.user, LogActions.DROPPED, control.start_time, SegmentType.FEC, first_seqno, len(segment))
     else:
-        Helpers.log_message('sender', LogActions.SEND, control.start_time, SegmentType.DATA, data_seqno, len(data))
-        control.socket.send(sent_segment)
+        Helpers.log_message(control.user, LogActions.SEND, control.start_time, SegmentType.FEC, first_seqno, len(segment))
+        control.transport.send(segment)
 
 def send_non_data(control: Control, segtype: SegmentType, segment: bytes, start_time: float):
     if Helpers.is_dropped(control.flp):
-        Helpers.log_message('sender', LogActions.DROPPED, start_time, segtype, control.seqno, 0)
+        Helpers.log_message(control.user, LogActions.DROPPED, start_time, segtype, control.seqno, 0)
     else:
-        Helpers.log_message('sender', LogActions.SEND, start_time, segtype, control.seqno, 0)
-        control.socket.send(segment)
-
-class Est_Threads:
-    @staticmethod 
-    def send_thread(control: Control, segment_control: SegmentControl):
-        segment_control.end = control.max_win / MSS
-        # Index within the sliding window
-        index = 0
+        Helpers.log_message(control.user, LogActions.SEND, start_time, segtype, control.seqno, 0)
+        control.transport.send(segment)
+
+class Est_Handlers:
+    @staticmethod
+    def fill_window(control: Control, segment_control: SegmentControl):
+        '''
+            Send new segments for as long as they fit in the window. Called on entering EST state
+            and after every ACK, which are the only events that open the window.
+
+            Args:
+                control (Control): The control block for the sender program.
+                segment_control (SegmentControl): The control block for data segments.
+        '''
+        scoreboard = segment_control.scoreboard
         # Number of segments
         num_segments = len(segment_control.segments)
-        while index < num_segments:
-            if index < segment_control.end:
-                data = segment_control.segments[index].data
-                segment_control.segments[index].is_sent = True
-                send_data(control, segment_control, control.seqno, data)
-                index += 1
-                control.seqno = Helpers.add_seqno(control.seqno, len(data))
-        return
+        while segment_control.next_index < num_segments:
+            data = segment_control.segments[segment_control.next_index]
+            # Only send when the segment fits in both our window and the one the receiver advertised.
+            # When the receiver's window is closed and nothing is in flight, send the segment anyway
+            # as a zero window probe: the retransmission timer keeps probing until the window opens.
+            is_probe = scoreboard.count == 0 and not scoreboard.can_send(len(data), control.rwnd)
+            if not (scoreboard.can_send(len(data), min(control.max_win, control.rwnd)) or is_probe):
+                break
+
+            if is_probe: print(f'zero window probe {control.seqno}')
+            send_data(control, segment_control, control.seqno, data)
+            segment_control.next_index += 1
+
+            # Follow every group of new segments with its parity
+            fec = segment_control.fec
+            if fec:
+                parity = fec.add(control.seqno, data, is_last=segment_control.next_index == num_segments)
+                if parity:
+                    send_fec(control, *parity)
+                    fec.adapt(Est_Handlers.loss_rate(segment_control))
+
+            control.seqno = Helpers.add_seqno(control.seqno, len(data))
 
     @staticmethod
-    def recv_thread(control: Control, segment_control: SegmentControl):
-        """The receiver thread function.
+    def loss_rate(segment_control: SegmentControl) -> float:
+        '''
+            The fraction of data segments lost, from how many the receiver reported to have received.
+            Losses that parity repaired count too, which retransmissions alone would not show.
+            Segments still in flight are left out, whether they will arrive or not is unknown yet.
+
+            Returns:
+                float: observed fraction of data segments lost, 0 until the receiver has reported
+        '''
+        scoreboard = segment_control.scoreboard
+        num_settled = scoreboard.total_sent + scoreboard.total_retrans - scoreboard.count
+        if num_settled <= 0 or segment_control.num_received == 0:
+            return 0.0
+        return max(0.0, 1 - segment_control.num_received / num_settled)
+
+    @staticmethod
+    def is_finished(control: Control, segment_control: SegmentControl) -> bool:
+        '''
+            Returns:
+                bool: whether everything has been ACKed, and in duplex mode the whole reply received
+        '''
+        return (segment_control.send_base == len(segment_control.segments)
+                and (control.reply is None or control.reply.is_done))
+
+    @staticmethod
+    def on_ack(control: Control, segment_control: SegmentControl, seqno: int, rwnd: int, is_pure: bool = True):
+        """Handle an ACK in EST state.
+
+        Slide the window over what it ACKs, fast retransmit on the third duplicate ACK and
+        send whatever new segments the window now has room for. Once everything is ACKed,
+        move on to CLOSING state.
 
-        The recv_thread() function is the entry point for the receiver thread. It
-        will sit in a loop, checking for messages from the receiver. When a message 
-        is received, the sender will unpack the message and print it to the log. 
-    
         Args:
             control (Control): The control block for the sender program.
             segment_control (SegmentControl): The control block for data segments.
+            seqno   (int): the next seqno the other side expects
+            rwnd    (int): the window it advertised
+            is_pure (bool, optional): False when the ACK came on a data segment, which is never
+            a duplicate ACK
         """
-        while control.is_est_state:
-            received_segment = control.socket.recv(BUF_SIZE)
-            segment_type, seqno, _ = Stp.extract_stp_segment(received_segment)
+        scoreboard = segment_control.scoreboard
+
+        # Slide the window over every segment this cumulative ACK covers
+        acked_cnt = scoreboard.on_ack(seqno, control.clock.now())
+        if acked_cnt > 0:
+            # Cancel any timer if exists, since entering this if condition means that
+            # the receiver has received a oldest unacked segment.
+            if control.timer != None:
+                control.timer.cancel()
+                control.timer = None
+            # If there are any unACKed segments, put timer on it
+            if scoreboard.count > 0:
+                print(f'recv put timer on {seqno}')
+                control.timer = control.clock.call_later(control.rto, Est_Handlers.on_timeout, (control, segment_control, seqno))
+
+            segment_control.send_base += acked_cnt
+            segment_control.dupACK_cnt = 0
+        # Take the advertised window from any ACK that is not older than the oldest unACKed seqno.
+        # An ACK that only reopens a closed window is a window update, not a duplicate ACK.
+        is_window_update = False
+        if seqno == scoreboard.base_seqno:
+            is_window_update = acked_cnt == 0 and control.rwnd < scoreboard.mss <= rwnd
+            control.rwnd = rwnd
+
+        if acked_cnt > 0:
+            # This signals the receiver has acknowledged everything. We can now jump to CLOSING state
+            if Est_Handlers.is_finished(control, segment_control):
+                States.state_closing(control)
+                return
+
+        elif is_window_update and scoreboard.count > 0:
+            # The receiver dropped our zero window probe, resend it now that there is room
+            print(f'window update, resend {seqno}')
+            send_data(control, segment_control, seqno, segment_control.segments[segment_control.send_base])
+
+        elif is_pure and seqno == scoreboard.base_seqno and scoreboard.count > 0:
+            # print(segment_control.dupACK_cnt)
+            segment_control.dupACK_cnt += 1
+            # Fast retransmit
+            if segment_control.dupACK_cnt == 3:
+                fast_retrans_data = segment_control.segments[segment_control.send_base]
+
+                send_data(control, segment_control, seqno, fast_retrans_data, is_loss=True)
+                print(f'dupACK for {seqno}')
 
-            if Helpers.is_dropped(control.rlp):
-                Helpers.log_message('sender', LogActions.DROPPED, control.start_time, segment_type, seqno, 0)
-                continue
-
-            Helpers.log_message('sender', LogActions.RECEIVE, control.start_time, segment_type, seqno, 0)
-
-            # Get the index of the received segment in segments[] via their seqno
-            # If the seqno doesnt exist in the map, then this segment should be the very last one of the file.
-            # Hence, let received_segment_index be the length of segments[] (why? will explain in next few lines)
-            segments_len = len(segment_control.segments)
-            received_segment_index = segment_control.seqno_map.get(seqno, segments_len)
-
-            if segment_control.send_base < received_segment_index:
-                control.lock.acquire()
-
-                # Cancel any timer if exists, since entering this if condition means that
-                # the receiver has received a oldest unacked segment.
-                if control.timer != None: 
-                    control.timer.cancel()
-                    control.timer = None
-                # If there are any unACKed segments, put timer on it
-                if received_segment_index <= min(segment_control.end, segments_len - 1) and segment_control.segments[received_segment_index].is_sent:
-                    print(f'recv put timer on {seqno}')
-                    control.timer = threading.Timer(control.rto, Est_Threads.timeout_thread, args=(control, segment_control, seqno))
-                    control.timer.start()
-                control.lock.release()
-
-                # This signals the receiver has acknowledged everything. We can know exit this thread
-                # and jump to CLOSING state
-                if received_segment_index == segments_len:
-                    control.is_est_state = False
-                    break
-
-                free_slots = received_segment_index - segment_control.send_base
-                # Set send_base equal to received_segment_index, means that
-                # we've already acknowledge all segments before this index in segments[] array.
-                segment_control.send_base = received_segment_index
-                # The difference between received_segment_index and send_base gives us
-                # the number of steps the sliding window can slide.
-                # Hence, we add this difference (namely free_slots) to "end" (the end index of the sliding window).
-                segment_control.end += free_slots
                 segment_control.dupACK_cnt = 0
 
-            elif segment_control.send_base == received_segment_index:
-                # print(segment_control.dupACK_cnt)
-                segment_control.dupACK_cnt += 1
-                # Fast retransmit
-                if segment_control.dupACK_cnt == 3:
-                    fast_retrans_data = segment_control.segments[received_segment_index].data
-
-                    send_data(control, segment_control, seqno, fast_retrans_data)
-                    print(f'dupACK for {seqno}')
-                    
-                    segment_control.dupACK_cnt = 0
-    
+        Est_Handlers.fill_window(control, segment_control)
+
     @staticmethod
-    def timeout_thread(control: Control, segment_control: SegmentControl, unACKed_seqno: int):
-        """ If enters this thread, the waiting for some unACKed segment exceeds time limit (rto).
+    def on_timeout(control: Control, segment_control: SegmentControl, unACKed_seqno: int):
+        """ If enters this handler, the waiting for some unACKed segment exceeds time limit (rto).
         We then retransmit oldest unACKed segment, restart timer, and reset dup ACK count.
         Args:
             control (Control): The control block for the sender program.
             segment_control (SegmentControl): The control block for data segments.
             unACKed_seqno (int): The oldest unACKed sequence number.
         """
-        segment_control.dupACK_cnt = 0
-
-        # Should we cancel any timer? Maybe not
-        segment_index = segment_control.seqno_map[unACKed_seqno]
-        data = segment_control.segments[segment_index].data
-        # Resend this segment
-        print(f'timeout for {unACKed_seqno}')
-        
-        control.lock.acquire()
-        control.timer = None
-        control.lock.release()
-
-        send_data(control, segment_control, unACKed_seqno, data)
-        
-class SynSent_Threads:
-    def recv_thread(control: Control):
-        while not control.is_connected:
-            response = control.socket.recv(BUF_SIZE)
-            segtype, seqno, _ = Stp.extract_stp_segment(response)
-            
-            if Helpers.is_dropped(control.rlp):
-                Helpers.log_message('sender', LogActions.DROPPED, control.start_time, SegmentType.ACK, seqno, 0)
-                continue
+        with control.lock:
+            if not control.is_est_state:
+                return
+            # Find the segment from its offset to the oldest unACKed one. If it has been ACKed
+            # meanwhile, a newer timer is already in charge.
+            offset = segment_control.scoreboard.lookup(unACKed_seqno)
+            if offset < 0:
+                return
+            data = segment_control.segments[segment_control.send_base + offset]
+            segment_control.dupACK_cnt = 0
+            control.timer = None
 
+            # Resend this segment. With the receiver's window closed, it is only a zero window probe.
+            print(f'timeout for {unACKed_seqno}')
+
+            send_data(control, segment_control, unACKed_seqno, data, is_loss=control.rwnd >= len(data))
+
+class SynSent_Handlers:
+    @staticmethod
+    def on_segment(control: Control, segtype: SegmentType, seqno: int, data: bytes):
+        options = Stp.extract_ack_options(data) if segtype == SegmentType.ACK else {}
+        # Only the ACK of our SYN, not one left over from an earlier SYN. With 0-RTT, the ACK of
+        # data the receiver did not take has the same seqno, but only the SYN ACK carries the MSS.
+        if (segtype == SegmentType.ACK and seqno == Helpers.add_seqno(control.syn_seqno, 1)
+                and (SynOption.MSS in options or control.segment_control is None)):
             control.timer.cancel()
+            control.timer = None
 
-            if segtype == SegmentType.ACK:
-                Helpers.log_message('sender', LogActions.RECEIVE, control.start_time, SegmentType.ACK, seqno, 0)
-                control.is_connected = True
+            # The receiver resumes from its checkpoint. Only go along if our file is the same up to
+            # there, otherwise connect again without asking to resume, so it starts the file over.
+            if SynOption.RESUME in options:
+                offset, digest = Stp.extract_resume_option(options[SynOption.RESUME])
+                prefix_hash = Helpers.hash_prefix(control.file_name, offset)
+                if prefix_hash is None or prefix_hash.digest() != digest:
+                    print(f'Cannot resume from byte {offset}, the receiver has a different file')
+                    control.is_resume = False
+                    # A new ISN, so the receiver tells the new SYN from a retransmitted one
+                    control.seqno = seqno
+                    States.state_syn_sent(control)
+                    return
+                control.offset = offset
+
+            control.is_connected = True
+            control.rwnd = Stp.extract_rwnd(data)
+            # If the receiver did not take the data sent with the SYN, forget it was ever sent
+            # and split the file again once the MSS is agreed
+            if control.segment_control and SynOption.FAST_OPEN not in options:
+                print('The receiver did not take the data sent with the SYN')
+                control.segment_control = None
+            if control.segment_control is None:
                 control.seqno = seqno
+                control.early_ack = None
+            # Use the MSS the receiver agreed on, a receiver that does not negotiate uses the default
+            control.mss = int.from_bytes(options[SynOption.MSS], 'big') if SynOption.MSS in options else DEFAULT_MSS
+
+            # The receiver agreed to send a reply, starting after its ISN
+            if (control.reply_file or control.is_delta) and SynOption.DUPLEX in options:
+                reply_isn = int.from_bytes(options[SynOption.DUPLEX], 'big')
+                buff = ReassemblyWindow(control.max_win, control.mss, Helpers.add_seqno(reply_isn, 1))
+                if SynOption.DELTA in options:
+                    # Delta mode: keep the signatures in memory, and send nothing until they are all in
+                    control.block_size = int.from_bytes(options[SynOption.DELTA], 'big')
+                    control.payload = b''
+                    writer = MemoryWriter()
+                else:
+                    writer = (control.writer_class or DiskWriter)(control.reply_file, FsyncPolicy.NONE, buff.num_slots)
+                ack_control = AckControl(control.clock, control.lock, lambda: Reply_Handlers.send_ack(control))
+                control.reply = ReplyControl(buff, writer, ack_control)
+                control.piggyback = lambda: Reply_Handlers.ack_info(control)
+                for early_seqno, early_data in control.early_reply or []:
+                    Reply_Handlers.on_data(control, early_seqno, Stp.extract_data_ack(early_data)[2])
+            elif control.is_delta:
+                print('The receiver has no earlier copy, send the whole file')
+            elif control.reply_file:
+                print('The receiver has no reply to send')
+            control.early_reply = None
+
+            States.state_est(control)
+
+            # An ACK of the data sent with the SYN may have arrived before the SYN ACK
+            if control.early_ack and control.is_est_state:
+                States.on_ack(control, *control.early_ack)
+            control.early_ack = None
+
+        elif segtype == SegmentType.DATA_ACK and (control.reply_file or control.is_delta):
+            # The receiver starts the reply as soon as it sends the SYN ACK, and a segment of it
+            # may overtake the SYN ACK. Keep a window of them until we know where the reply starts.
+            control.early_reply = control.early_reply or []
+            if sum(len(d) for _, d in control.early_reply) + len(data) <= control.max_win:
+                control.early_reply.append((seqno, data))
+
+        elif segtype == SegmentType.ACK and control.segment_control and control.segment_control.next_index:
+            # ACKs are cumulative, keep the one that covers the most
+            first_seqno = Helpers.add_seqno(control.syn_seqno, 1)
+            if control.early_ack is None or (seqno - first_seqno) % MAX_SEQNO > (control.early_ack[0] - first_seqno) % MAX_SEQNO:
+                control.early_ack = (seqno, Stp.extract_rwnd(data))
 
-    def timeout_thread(control: Control, stp_segment: bytes):
-        control.lock.acquire()
+    @staticmethod
+    def on_timeout(control: Control, stp_segment: bytes):
+        with control.lock:
+            # The SYN ACK arrived while this timer was firing
+            if control.is_connected:
+                return
 
-        control.timer = threading.Timer(control.rto, SynSent_Threads.timeout_thread, (control, stp_segment))
-        control.timer.start()
+            control.timer = control.clock.call_later(control.rto, SynSent_Handlers.on_timeout, (control, stp_segment))
 
-        control.lock.release()
+            send_non_data(control, SegmentType.SYN, stp_segment, control.start_time)
 
-        if Helpers.is_dropped(control.flp):
-            Helpers.log_message('sender', LogActions.DROPPED, control.start_time, SegmentType.SYN, control.seqno, 0)
-        else:
-            Helpers.log_message('sender', LogActions.SEND, control.start_time, SegmentType.SYN, control.seqno, 0)
-            control.socket.send(stp_segment)
-
-class Closing_Threads:
-    def receive_thread(control: Control):
-        # When waiting for FINACK, we're expecting last seqno + 1.
-        expected_seqno = control.seqno + 1
-        while True:
-            response = control.socket.recv(BUF_SIZE)
-            segtype, seqno, _ = Stp.extract_stp_segment(response)
-            
-            if Helpers.is_dropped(control.rlp):
-                Helpers.log_message('sender', LogActions.DROPPED, control.start_time, SegmentType.ACK, seqno, 0)
-                continue
-            
-            Helpers.log_message('sender', LogActions.RECEIVE, control.start_time, SegmentType.ACK, seqno, 0)
-            # If received FINACK, terminates this thread. Otherwise, this must be an ACK from Est state,
-            # we just simply ignore it (of course we logged it out as well)
-            if seqno == expected_seqno:
-                control.timer.cancel()
+class Closing_Handlers:
+    @staticmethod
+    def on_ack(control: Control, seqno: int):
+        # When waiting for FINACK, we're expecting last seqno + 1. If received FINACK, we are done.
+        # Otherwise, this must be an ACK from Est state, we just simply ignore it (of course we logged it out as well)
+        if seqno == Helpers.add_seqno(control.seqno, 1):
+            control.timer.cancel()
+            control.timer = None
+            control.is_closed = True
+            control.end_time = control.clock.now()
+            if control.reply:
+                DelayedAck.close(control.reply.ack_control)
+
+    @staticmethod
+    def on_timeout(control: Control, stp_segment: bytes):
+        with control.lock:
+            # The FIN ACK arrived while this timer was firing
+            if control.is_closed:
                 return
 
-    def timeout_thread(control: Control, stp_segment: bytes):
-        control.lock.acquire()
+            control.timer = control.clock.call_later(control.rto, Closing_Handlers.on_timeout, (control, stp_segment))
 
-        control.timer = threading.Timer(control.rto, Closing_Threads.timeout_thread, (control, stp_segment))
-        control.timer.start()
+            send_non_data(control, SegmentType.FIN, stp_segment, control.start_time)
 
-        control.lock.release()
+class Reply_Handlers:
+    '''
+        Receive side of the sender in duplex mode: the reply, reassembled and written like the
+        receiver does with our data.
+    '''
+    @staticmethod
+    def on_data(control: Control, seqno: int, data: bytes):
+        reply = control.reply
+        DelayedAck.on_data(reply.ack_control, reply.buff, reply.writer, seqno, data)
 
-        send_non_data(control, SegmentType.FIN, stp_segment, control.start_time)
\ No newline at end of file
+    @staticmethod
+    def on_fin(control: Control, seqno: int):
+        reply = control.reply
+        # The FIN only comes once we have ACKed the whole reply, any other is left over from earlier
+        if not reply.is_done and seqno == reply.buff.expct_seqno:
+            print('Received the whole reply')
+            reply.is_done = True
+            reply.writer.close(is_complete=True)
+            if control.block_size:
+                Reply_Handlers.start_delta(control)
+            if control.is_est_state and Est_Handlers.is_finished(control, control.segment_control):
+                States.state_closing(control)
+            elif control.is_est_state:
+                Est_Handlers.fill_window(control, control.segment_control)
+        # ACK the FIN at once, again if it was retransmitted
+        if reply.is_done:
+            Reply_Handlers.send_ack(control)
+
+    @staticmethod
+    def start_delta(control: Control):
+        '''
+            Delta mode: with all the signatures of the receiver's copy in, work out what it lacks
+            and send that in place of the file.
+        '''
+        with open(control.file_name, 'rb') as f:
+            data = f.read()
+        control.payload = Delta.create_delta(data, control.reply.writer.getvalue(), control.block_size)
+        print(f'Delta of {len(control.payload)} bytes for {len(data)} bytes of file')
+        # Nothing has been sent yet, the segments start where the empty ones did
+        States.create_segment_control(control, control.seqno)
+
+    @staticmethod
+    def ack_info(control: Control):
+        '''
+            Returns:
+                int: the next seqno of the reply we expect, past the FIN once it has arrived
+                int: how much more of the reply we can take
+        '''
+        reply = control.reply
+        ack, rwnd = DelayedAck.ack_info(reply.ack_control, reply.buff, reply.writer)
+        if reply.is_done:
+            ack = Helpers.add_seqno(ack, 1)
+        return ack, rwnd
+
+    @staticmethod
+    def send_ack(control: Control):
+        ack, rwnd = Reply_Handlers.ack_info(control)
+        if Helpers.is_dropped(control.flp):
+            Helpers.log_message(control.user, LogActions.DROPPED, control.start_time, SegmentType.ACK, ack, 0)
+        else:
+            Helpers.log_message(control.user, LogActions.SEND, control.start_time, SegmentType.ACK, ack, 0)
+            control.transport.send(Stp.create_ack_segment(ack, rwnd))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+###
+# Simulator
+# =========
+# Runs whole transfers between the sender and receiver state machines without sockets or threads.
+# Segments travel over a simulated network with seeded loss, delay and jitter (which reorders
+# segments), and timers run on a virtual clock, so a transfer that takes minutes over loopback
+# takes a fraction of a second, and the same seed always gives the same transfer.
+#
+# Every comma separated value of max_win, rto and loss is combined with every other one, e.g.
+#   python run.py simulator tests/asyoulik.txt 4000,8000 50,200 0,0.1,0.2 10 --runs=20
+###
+
+import contextlib
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from src.helpers.arg_parser import ArgParser
+from src.helpers.helpers import Helpers
+from src.helpers.runtime import Clock, Transport
+from src.helpers.stp_helpers import Stp, DEFAULT_MSS, MAX_MSS
+from src.sender.sender_prototypes import Control as SenderControl, MAX_SEQNO
+from src.sender.states import States
+from src.receiver.receiver import Control as ReceiverControl, handle_segment
+
+NUM_ARGS = 5  # Number of command-line arguments
+TIME_LIMIT = 3600 * 1000  # Virtual miliseconds after which a transfer is given up
+
+class SimTimer:
+    '''
+        A pending event of the simulator. Cancelling it keeps it in the queue, it is skipped when its time comes.
+    '''
+    __slots__ = ('is_cancelled',)
+
+    def __init__(self) -> None:
+        self.is_cancelled = False
+
+    def cancel(self) -> None:
+        self.is_cancelled = True
+
+class Simulator:
+    '''
+        Discrete event simulator: a priority queue of events ordered by virtual time, and the
+        random number generator every random choice of the simulated network is drawn from.
+    '''
+    def __init__(self, seed: int) -> None:
+        self.time = 0.0     # Virtual time in miliseconds
+        self.events = []
+        # Breaks ties between events at the same time, in the order they were scheduled
+        self.counter = itertools.count()
+        self.random = random.Random(seed)
+        self.num_events = 0
+
+    def schedule(self, delay: float, function, args: tuple = ()) -> SimTimer:
+        '''
+            Args:
+                delay       (float): miliseconds from now
+                function    (callable): the event handler
+                args        (tuple, optional): arguments for the handler
+            Returns:
+                SimTimer: the event, which can be cancelled
+        '''
+        timer = SimTimer()
+        heapq.heappush(self.events, (self.time + delay, next(self.counter), timer, function, args))
+        return timer
+
+    def run(self, time_limit: float) -> None:
+        '''
+            Run events in time order until there are none left or time_limit is reached.
+        '''
+        while self.events:
+            event_time, _, timer, function, args = heapq.heappop(self.events)
+            if event_time > time_limit:
+                return
+            if timer.is_cancelled:
+                continue
+            self.time = event_time
+            self.num_events += 1
+            function(*args)
+
+class SimClock(Clock):
+    def __init__(self, sim: Simulator) -> None:
+        self.sim = sim
+
+    def now(self) -> float:
+        return self.sim.time
+
+    def call_later(self, delay: float, function, args: tuple = ()) -> SimTimer:
+        return self.sim.schedule(delay * 1000, function, args)
+
+class SimLink(Transport):
+    '''
+        One direction of the simulated network. Every segment is lost with probability "loss",
+        otherwise it arrives "delay" plus up to "jitter" miliseconds later. With jitter, a segment
+        may overtake the ones sent just before it.
+    '''
+    def __init__(self, sim: Simulator, loss: float, delay: float, jitter: float, deliver) -> None:
+        '''
+            Args:
+                sim     (Simulator): the simulator
+                loss    (float): probability of a segment being lost
+                delay   (float): one way delay in miliseconds
+                jitter  (float): largest extra delay in miliseconds
+                deliver (callable): handler of a segment at the other end
+        '''
+        self.sim = sim
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.deliver = deliver
+        self.num_sent = 0
+        self.num_lost = 0
+
+    def send(self, segment: bytes) -> None:
+        self.num_sent += 1
+        if self.sim.random.random() < self.loss:
+            self.num_lost += 1
+            return
+        self.sim.schedule(self.delay + self.sim.random.uniform(0, self.jitter), self.deliver, (segment,))
+
+    def close(self) -> None:
+        pass
+
+class DigestWriter:
+    '''
+        Stands in for DiskWriter on both sides: keeps only the sha256 digest of what is received,
+        so a simulated transfer needs no more memory than the file being sent, however large.
+        It takes the arguments of DiskWriter, but never resumes.
+    '''
+    def __init__(self, *args, patcher=None, **kwargs) -> None:
+        self.hash = hashlib.sha256()
+        self.backlog = 0
+        self.patcher = patcher
+
+    def submit(self, data: bytes) -> None:
+        if self.patcher:
+            for run in self.patcher.feed(data):
+                self.hash.update(run)
+        else:
+            self.hash.update(data)
+
+    def close(self, is_complete: bool = False) -> None:
+        pass
+
+    def digest(self) -> bytes:
+        return self.hash.digest()
+
+def file_digest(file_name: str) -> bytes:
+    return Helpers.hash_prefix(file_name, os.path.getsize(file_name)).digest()
+
+@dataclass
+class SimResult:
+    """Outcome of one simulated transfer."""
+    is_complete: bool       # whether the sender got its FIN ACKed before the time limit
+    is_identical: bool      # whether the receiver got exactly the file that was sent, and the sender the reply
+    completion_time: float  # virtual miliseconds from the SYN to the FIN ACK
+    num_sent: int           # data segments sent, retransmissions excluded
+    num_retrans: int        # data segments retransmitted
+    num_recovered: int      # data segments the receiver rebuilt with FEC
+    num_events: int         # events the simulator ran
+
+def simulate_transfer(file_name: str, max_win: int, rto: float, loss: float, delay: float, jitter: float = 0.0,
+                      seed: int = 0, mss: int = DEFAULT_MSS, fec: tuple = (0, False), rcvr_max_win: int = None,
+                      rlp: float = None, reply_file: str = None, is_fast_open: bool = False,
+                      basis_file: str = None) -> SimResult:
+    '''
+        Run one transfer of file_name on virtual time.
+
+        Args:
+            file_name   (str): file to send
+            max_win     (int): max_win of the sender, and of the receiver unless rcvr_max_win is given
+            rto         (float): retransmission timeout in seconds
+            loss        (float): probability of a segment from the sender being lost
+            delay       (float): one way delay in miliseconds
+            jitter      (float, optional): largest extra one way delay in miliseconds
+            seed        (int, optional): seed of every random choice, including the ISN
+            mss         (int, optional): MSS the sender proposes
+            fec         (tuple, optional): (group size, adaptive) as returned by ArgParser.parse_fec()
+            rcvr_max_win(int, optional): max_win of the receiver
+            rlp         (float, optional): probability of a segment from the receiver being lost,
+            the same as loss by default
+            reply_file  (str, optional): file the receiver sends back, in duplex mode
+            is_fast_open(bool, optional): whether the sender sends its first window with the SYN
+            basis_file  (str, optional): earlier copy of the file the receiver has, for delta mode.
+            It is only read, only the digest of the received file is kept.
+        Returns:
+            SimResult
+    '''
+    sim = Simulator(seed)
+    clock = SimClock(sim)
+
+    receiver = ReceiverControl(0, 0, basis_file, rcvr_max_win or max_win, MAX_MSS, transport=None, clock=clock,
+                               writer_class=DigestWriter, lock=threading.Lock(), reply_file=reply_file,
+                               rng=sim.random)
+    receiver.buf_size = Stp.buf_size(min(MAX_MSS, receiver.max_win))
+    sender = SenderControl(sender_port=0, rcvr_port=0, transport=None, clock=clock, max_win=max_win,
+                           seqno=sim.random.randrange(MAX_SEQNO), rto=rto, file_name=file_name,
+                           flp=0.0, rlp=0.0, lock=threading.Lock(), mss=mss,
+                           fec_group=fec[0], fec_adaptive=fec[1], reply_file=reply_file,
+                           writer_class=DigestWriter, is_fast_open=is_fast_open,
+                           is_delta=basis_file is not None)
+    # Each side reads a segment into a buffer of its current buf_size, as recv() does, and
+    # whatever does not fit is cut off
+    sender.transport = SimLink(sim, loss, delay, jitter,
+                               lambda segment: handle_segment(receiver, segment[:receiver.buf_size]))
+    receiver.transport = SimLink(sim, loss if rlp is None else rlp, delay, jitter,
+                                 lambda segment: States.on_segment(sender, segment[:sender.buf_size]))
+
+    with sender.lock:
+        States.state_syn_sent(sender)
+    sim.run(TIME_LIMIT)
+
+    is_identical = receiver.writer is not None and receiver.writer.digest() == file_digest(file_name)
+    if reply_file:
+        is_identical = is_identical and sender.reply is not None and sender.reply.writer.digest() == file_digest(reply_file)
+    segment_control = sender.segment_control
+    return SimResult(is_complete=sender.is_closed,
+                     is_identical=is_identical,
+                     completion_time=sender.end_time - sender.start_time,
+                     num_sent=segment_control.scoreboard.total_sent if segment_control else 0,
+                     num_retrans=segment_control.scoreboard.total_retrans if segment_control else 0,
+                     num_recovered=receiver.buff.total_recovered if receiver.buff else 0,
+                     num_events=sim.num_events)
+
+if __name__ == "__main__":
+    if len(sys.argv) < NUM_ARGS + 1:
+        sys.exit(f"Usage: {sys.argv[0]} txt_file_to_send max_win[,max_win...] rto[,rto...] loss[,loss...] delay [--jitter=ms] [--rlp=prob] [--runs=count] [--seed=seed] [--mss=bytes] [--fec=segments|auto] [--reply=file] [--fast-open] [--basis=file]")
+
+    txt_file_to_send = ArgParser.parse_file_name(sys.argv[1])
+    max_wins = [ArgParser.parse_max_win(v) for v in sys.argv[2].split(',')]
+    rtos = [ArgParser.parse_rto(v) for v in sys.argv[3].split(',')]
+    losses = [ArgParser.parse_prop(v) for v in sys.argv[4].split(',')]
+    delay = ArgParser.parse_delay(sys.argv[5])
+    options = ArgParser.parse_options(sys.argv[NUM_ARGS + 1:], ('jitter', 'rlp', 'runs', 'seed', 'mss', 'fec', 'reply', 'fast-open', 'basis'))
+    jitter = ArgParser.parse_delay(options.get('jitter', 0))
+    rlp = ArgParser.parse_prop(options['rlp']) if 'rlp' in options else None
+    runs = int(options.get('runs', 10))
+    seed = int(options.get('seed', 0))
+    mss = ArgParser.parse_mss(options.get('mss', DEFAULT_MSS))
+    fec = ArgParser.parse_fec(options['fec']) if 'fec' in options else (0, False)
+    reply_file = ArgParser.parse_file_name(options['reply']) if 'reply' in options else None
+    is_fast_open = ArgParser.parse_flag(options.get('fast-open', 'false'))
+    basis_file = ArgParser.parse_file_name(options['basis']) if 'basis' in options else None
+    if min(max_wins) < mss:
+        sys.exit(f"Invalid max_win, must hold at least one segment of {mss} bytes: {min(max_wins)}")
+
+    # The state machines print as they go and would log every segment
+    Helpers.is_logging = False
+
+    print(f"{'max_win':>8} {'rto':>6} {'loss':>5}  {'mean':>9} {'min':>9} {'max':>9}  {'retrans':>8}  {'failed':>6}")
+    start = time.time()
+    num_events = 0
+    for max_win, rto, loss in itertools.product(max_wins, rtos, losses):
+        times = []
+        num_retrans = 0
+        num_failed = 0
+        for run in range(runs):
+            # The same seeds for every combination, so they all see comparable networks
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = simulate_transfer(txt_file_to_send, max_win, rto, loss, delay, jitter,
+                                           seed=seed + run, mss=mss, fec=fec, rlp=rlp,
+                                           reply_file=reply_file, is_fast_open=is_fast_open,
+                                           basis_file=basis_file)
+            num_events += result.num_events
+            if not (result.is_complete and result.is_identical):
+                num_failed += 1
+                continue
+            times.append(result.completion_time / 1000)
+            num_retrans += result.num_retrans
+
+        if times:
+            print(f"{max_win:>8} {round(rto * 1000):>6} {loss:>5}  {sum(times) / len(times):8.2f}s {min(times):8.2f}s {max(times):8.2f}s  {num_retrans / len(times):8.1f}  {num_failed:>6}")
+        else:
+            print(f"{max_win:>8} {round(rto * 1000):>6} {loss:>5}  {'-':>9} {'-':>9} {'-':>9}  {'-':>8}  {num_failed:>6}")
+
+    print(f"Simulated {num_events} events in {time.time() - start:.2f}s")
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import time
+import pytest
+from src.enums import FsyncPolicy
+from src.receiver import writer
+from src.receiver.checkpoint import Checkpoint
+from src.receiver.writer import DiskWriter
+
+DATA = os.urandom(5000)
+
+@pytest.fixture
+def output_file(tmp_path):
+    return str(tmp_path / 'received.txt')
+
+def test_round_trip(output_file):
+    with open(output_file, 'wb') as f:
+        f.write(DATA)
+    Checkpoint.save(output_file, 3000, hashlib.sha256(DATA[:3000]).digest())
+    offset, prefix_hash = Checkpoint.load(output_file)
+    assert offset == 3000
+    assert prefix_hash.digest() == hashlib.sha256(DATA[:3000]).digest()
+    # The hash carries on from the prefix
+    prefix_hash.update(DATA[3000:])
+    assert prefix_hash.digest() == hashlib.sha256(DATA).digest()
+
+def test_no_checkpoint(output_file):
+    with open(output_file, 'wb') as f:
+        f.write(DATA)
+    assert Checkpoint.load(output_file) is None
+    with open(Checkpoint.path(output_file), 'wb') as f:
+        f.write(b'too short')
+    assert Checkpoint.load(output_file) is None
+
+def test_prefix_mismatch(output_file):
+    with open(output_file, 'wb') as f:
+        f.write(DATA)
+    Checkpoint.save(output_file, 3000, hashlib.sha256(DATA[:3000]).digest())
+    # The file changed before the checkpoint
+    with open(output_file, 'r+b') as f:
+        f.seek(100)
+        f.write(bytes([DATA[100] ^ 1]))
+    assert Checkpoint.load(output_file) is None
+
+def test_file_shorter_than_checkpoint(output_file):
+    with open(output_file, 'wb') as f:
+        f.write(DATA[:2000])
+    Checkpoint.save(output_file, 3000, hashlib.sha256(DATA[:3000]).digest())
+    assert Checkpoint.load(output_file) is None
+
+def test_close_takes_checkpoint(output_file):
+    disk_writer = DiskWriter(output_file, FsyncPolicy.NONE, 4)
+    disk_writer.submit(DATA[:1234])
+    disk_writer.close()
+    offset, prefix_hash = Checkpoint.load(output_file)
+    assert offset == 1234
+    assert prefix_hash.digest() == hashlib.sha256(DATA[:1234]).digest()
+
+def test_periodic_checkpoint(output_file, monkeypatch):
+    monkeypatch.setattr(writer, 'CHECKPOINT_INTERVAL', 1000)
+    disk_writer = DiskWriter(output_file, FsyncPolicy.NONE, 4)
+    disk_writer.submit(DATA[:1500])
+    disk_writer.submit(DATA[1500:1700])
+    # Wait for the thread to write both runs, without the checkpoint close() takes
+    while disk_writer.backlog:
+        time.sleep(0.001)
+    assert Checkpoint.load(output_file)[0] >= 1000
+    disk_writer.close(is_complete=True)
+    assert not os.path.exists(Checkpoint.path(output_file))
+
+@pytest.mark.parametrize('has_pwritev', [True, False])
+def test_resume(output_file, monkeypatch, has_pwritev):
+    if not has_pwritev:
+        # Writes then go to the current position of the file
+        monkeypatch.delattr(os, 'pwritev', raising=False)
+        monkeypatch.delattr(os, 'pwrite', raising=False)
+    # An interrupted transfer: a checkpoint at 3000, and more written after it
+    with open(output_file, 'wb') as f:
+        f.write(DATA[:3000] + os.urandom(700))
+    Checkpoint.save(output_file, 3000, hashlib.sha256(DATA[:3000]).digest())
+
+    offset, prefix_hash = Checkpoint.load(output_file)
+    disk_writer = DiskWriter(output_file, FsyncPolicy.NONE, 4, offset=offset, prefix_hash=prefix_hash)
+    # Whatever was written after the checkpoint is dropped
+    assert os.path.getsize(output_file) == 3000
+    disk_writer.submit(DATA[3000:4000])
+    disk_writer.submit(DATA[4000:])
+    disk_writer.close(is_complete=True)
+
+    with open(output_file, 'rb') as f:
+        assert f.read() == DATA
+    assert not os.path.exists(Checkpoint.path(output_file))
+
+def test_start_over_removes_checkpoint(output_file):
+    with open(output_file, 'wb') as f:
+        f.write(DATA)
+    Checkpoint.save(output_file, 3000, hashlib.sha256(DATA[:3000]).digest())
+    disk_writer = DiskWriter(output_file, FsyncPolicy.NONE, 4)
+    assert not os.path.exists(Checkpoint.path(output_file))
+    assert os.path.getsize(output_file) == 0
+    disk_writer.submit(DATA[:10])
+    disk_writer.close(is_complete=True)
+    with open(output_file, 'rb') as f:
+        assert f.read() == DATA[:10]
@@ -0,0 +1,123 @@
+import threading
+from src.helpers.stp_helpers import ACK_DELAY, ACK_WINDOW_SHARE
+from src.receiver.delayed_ack import AckControl, DelayedAck
+from src.receiver.reassembly import ReassemblyWindow
+from src.receiver.writer import MemoryWriter
+
+MSS = 100
+MAX_WIN = 10 * MSS
+
+class Timer:
+    def __init__(self, delay, function, args):
+        self.delay = delay
+        self.function = function
+        self.args = args
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def fire(self):
+        self.function(*self.args)
+
+class Clock:
+    def __init__(self):
+        self.timers = []
+
+    def now(self):
+        return 0.0
+
+    def call_later(self, delay, function, args=()):
+        self.timers.append(Timer(delay, function, args))
+        return self.timers[-1]
+
+class Endpoint:
+    '''
+        The receive side of an endpoint, counting the ACKs sent on their own.
+    '''
+    def __init__(self):
+        self.clock = Clock()
+        self.buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+        self.writer = MemoryWriter()
+        self.acks = []
+        self.ack_control = AckControl(self.clock, threading.Lock(), self.send_ack)
+        # As after the SYN ACK
+        self.send_ack()
+
+    def send_ack(self):
+        self.acks.append(DelayedAck.ack_info(self.ack_control, self.buff, self.writer))
+
+    def on_data(self, seqno, can_piggyback=True):
+        DelayedAck.on_data(self.ack_control, self.buff, self.writer, seqno, b'x' * MSS, can_piggyback)
+
+def test_in_order_data_waits_for_a_segment():
+    endpoint = Endpoint()
+    endpoint.on_data(0)
+    assert endpoint.acks == [(0, MAX_WIN)]
+    assert endpoint.ack_control.is_ack_pending
+    # A data segment carries the ACK
+    assert DelayedAck.ack_info(endpoint.ack_control, endpoint.buff, endpoint.writer) == (MSS, MAX_WIN)
+    assert not endpoint.ack_control.is_ack_pending
+    assert endpoint.writer.getvalue() == b'x' * MSS
+
+def test_out_of_order_and_gap_filling_acked_at_once():
+    endpoint = Endpoint()
+    endpoint.on_data(MSS)
+    assert endpoint.acks[-1] == (0, MAX_WIN)
+    # Fills the gap, delivering both
+    endpoint.on_data(0)
+    assert endpoint.acks[-1] == (2 * MSS, MAX_WIN)
+    # A duplicate
+    endpoint.on_data(0)
+    assert len(endpoint.acks) == 4
+    assert not endpoint.ack_control.is_ack_pending
+
+def test_no_piggyback():
+    endpoint = Endpoint()
+    endpoint.on_data(0, can_piggyback=False)
+    assert endpoint.acks[-1] == (MSS, MAX_WIN)
+
+def test_delay_then_ack():
+    endpoint = Endpoint()
+    endpoint.on_data(0)
+    DelayedAck.after_segment(endpoint.ack_control, True, 1.0)
+    DelayedAck.after_segment(endpoint.ack_control, True, 1.0)
+    # One timer, well below the RTO
+    assert len(endpoint.clock.timers) == 1
+    assert endpoint.clock.timers[0].delay == min(ACK_DELAY, 1.0 / 4)
+    endpoint.clock.timers[0].fire()
+    assert endpoint.acks[-1] == (MSS, MAX_WIN)
+    assert endpoint.ack_control.ack_timer is None
+
+def test_ack_sent_cancels_delay():
+    endpoint = Endpoint()
+    endpoint.on_data(0)
+    DelayedAck.after_segment(endpoint.ack_control, True, 1.0)
+    timer = endpoint.clock.timers[0]
+    DelayedAck.ack_info(endpoint.ack_control, endpoint.buff, endpoint.writer)
+    assert timer.is_cancelled
+    # Had it fired already, it finds nothing to ACK
+    timer.fire()
+    assert len(endpoint.acks) == 1
+
+def test_ack_now_without_new_data_or_window():
+    endpoint = Endpoint()
+    endpoint.on_data(0)
+    DelayedAck.after_segment(endpoint.ack_control, False, 1.0)
+    assert endpoint.acks[-1] == (MSS, MAX_WIN)
+    # Enough data unACKed to use up a share of the window
+    for i in range(1, MAX_WIN // ACK_WINDOW_SHARE // MSS + 2):
+        endpoint.on_data(i * MSS)
+    DelayedAck.after_segment(endpoint.ack_control, True, 1.0)
+    assert not endpoint.clock.timers
+    assert not endpoint.ack_control.is_ack_pending
+
+def test_closed():
+    endpoint = Endpoint()
+    endpoint.on_data(0)
+    DelayedAck.after_segment(endpoint.ack_control, True, 1.0)
+    timer = endpoint.clock.timers[0]
+    DelayedAck.close(endpoint.ack_control)
+    assert timer.is_cancelled
+    timer.fire()
+    assert len(endpoint.acks) == 1
@@ -0,0 +1,102 @@
+import random
+import pytest
+from src.helpers import delta
+from src.helpers.delta import Delta, DeltaPatcher
+
+def edit(rng, data):
+    '''
+        A copy of data with a few bytes changed, removed and inserted at random places.
+    '''
+    data = bytearray(data)
+    for _ in range(rng.randrange(1, 6)):
+        start = rng.randrange(len(data) + 1)
+        length = rng.randrange(1, 200)
+        kind = rng.randrange(3)
+        if kind == 0:
+            data[start:start + length] = rng.randbytes(length)
+        elif kind == 1:
+            del data[start:start + length]
+        else:
+            data[start:start] = rng.randbytes(length)
+    return bytes(data)
+
+def cases(num_cases):
+    '''
+        Yields (old file, new file, block size), the files random, or repetitive for many
+        weak checksum matches.
+    '''
+    rng = random.Random(0)
+    for i in range(num_cases):
+        size = rng.randrange(0, 20000)
+        if i % 2:
+            old = rng.randbytes(size)
+        else:
+            old = bytes(rng.choice(b'ab') for _ in range(size))
+        yield old, edit(rng, old), rng.choice([8, 16, 100, 700])
+
+def rebuild(tmp_path, old, instructions, block_size, rng):
+    path = tmp_path / 'old.txt'
+    path.write_bytes(old)
+    patcher = DeltaPatcher(str(path), block_size)
+    runs = []
+    # Instructions arrive split at arbitrary places, as they do across segments
+    i = 0
+    while i < len(instructions):
+        length = rng.randrange(1, 300)
+        runs.extend(patcher.feed(instructions[i:i + length]))
+        i += length
+    patcher.close()
+    return b''.join(runs)
+
+def create_delta(tmp_path, old, new, block_size):
+    path = tmp_path / 'old.txt'
+    path.write_bytes(old)
+    return Delta.create_delta(new, Delta.create_signatures(str(path), block_size), block_size)
+
+def test_weak_checksum_rolls():
+    data = random.Random(1).randbytes(500)
+    table = {Delta.weak_checksum(data[300:316]): {Delta.strong_hash(data[300:316]): 7}}
+    assert list(Delta.find_matches(data, table, 16)) == [(300, 7)]
+
+def test_create_signatures(tmp_path):
+    data = random.Random(2).randbytes(1000)
+    path = tmp_path / 'old.txt'
+    path.write_bytes(data)
+    signatures = Delta.create_signatures(str(path), 300)
+    # The tail shorter than a block has no signature
+    assert len(signatures) == 3 * delta.SIGNATURE_SIZE
+    assert signatures[delta.SIGNATURE_SIZE:2 * delta.SIGNATURE_SIZE] == \
+        Delta.weak_checksum(data[300:600]).to_bytes(delta.WEAK_SIZE, 'big') + Delta.strong_hash(data[300:600])
+
+def test_rebuild_pure_python(tmp_path, monkeypatch):
+    monkeypatch.setattr(delta, 'np', None)
+    rng = random.Random(3)
+    for old, new, block_size in cases(40):
+        assert rebuild(tmp_path, old, create_delta(tmp_path, old, new, block_size), block_size, rng) == new
+
+def test_unchanged_file_is_copied(tmp_path):
+    data = random.Random(4).randbytes(7000)
+    instructions = create_delta(tmp_path, data, data, 700)
+    # One copy of every block
+    assert instructions == bytes([delta.COPY]) + (0).to_bytes(4, 'big') + (10).to_bytes(4, 'big')
+
+def test_invalid_instruction(tmp_path):
+    path = tmp_path / 'old.txt'
+    path.write_bytes(b'x' * 100)
+    patcher = DeltaPatcher(str(path), 10)
+    with pytest.raises(ValueError):
+        list(patcher.feed(b'\x07'))
+    patcher.close()
+
+@pytest.mark.parametrize('scan_chunk', [5, 37, 1000, delta.SCAN_CHUNK])
+def test_vectorized_matches_pure_python(tmp_path, monkeypatch, scan_chunk):
+    np = pytest.importorskip('numpy')
+    # Small chunks put chunk boundaries inside blocks and between candidates
+    monkeypatch.setattr(delta, 'SCAN_CHUNK', scan_chunk)
+    rng = random.Random(5)
+    for old, new, block_size in cases(40):
+        monkeypatch.setattr(delta, 'np', np)
+        vectorized = create_delta(tmp_path, old, new, block_size)
+        monkeypatch.setattr(delta, 'np', None)
+        assert vectorized == create_delta(tmp_path, old, new, block_size)
+        assert rebuild(tmp_path, old, vectorized, block_size, rng) == new
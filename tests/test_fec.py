@@ -0,0 +1,58 @@
+import pytest
+from src.enums import SynOption
+from src.helpers.fec import Fec, FecEncoder, MAX_FEC_GROUP
+from src.helpers.helpers import Helpers
+from src.helpers.stp_helpers import Stp
+from src.sender.states import States, Est_Handlers
+
+MSS = 100
+
+def test_group_size_for():
+    assert Fec.group_size_for(0.0) == MAX_FEC_GROUP
+    assert Fec.group_size_for(0.1) == 4
+    assert Fec.group_size_for(0.5) == 1
+
+def test_adapt_between_groups_only():
+    encoder = FecEncoder(MAX_FEC_GROUP, is_adaptive=True)
+    encoder.add(0, b'x' * MSS)
+    encoder.adapt(0.1)
+    assert encoder.group_size == MAX_FEC_GROUP
+    encoder.reset()
+    encoder.adapt(0.1)
+    assert encoder.group_size == 4
+    # A fixed group size never changes
+    encoder = FecEncoder(8)
+    encoder.adapt(0.1)
+    assert encoder.group_size == 8
+
+def segment_control_with(num_sent, num_retrans, num_in_flight):
+    segment_control = Helpers.create_segment_control_from_bytes(b'x' * MSS * (num_sent + 1), 0, MSS * (num_sent + 1), MSS)
+    scoreboard = segment_control.scoreboard
+    for i in range(num_sent):
+        scoreboard.on_send(i * MSS, MSS, 0.0)
+    for _ in range(num_retrans):
+        scoreboard.on_send(scoreboard.base_seqno, MSS, 0.0, is_loss=True)
+    scoreboard.on_ack((num_sent - num_in_flight) * MSS, 0.0)
+    return segment_control
+
+def test_loss_rate():
+    segment_control = segment_control_with(100, 0, 0)
+    # Nothing reported yet
+    assert Est_Handlers.loss_rate(segment_control) == 0.0
+    States.on_received_report(segment_control, Stp.extract_ack_options(
+        Stp.create_ack_segment(0, 0, Stp.create_options({SynOption.RECEIVED: (90).to_bytes(4, 'big')}))[4:]))
+    assert Est_Handlers.loss_rate(segment_control) == pytest.approx(0.1)
+
+def test_loss_rate_counts_retransmissions_and_skips_in_flight():
+    segment_control = segment_control_with(100, 10, 20)
+    segment_control.num_received = 72
+    # 110 segments sent, 20 of them still in flight
+    assert Est_Handlers.loss_rate(segment_control) == pytest.approx(0.2)
+
+def test_received_report_keeps_highest():
+    segment_control = segment_control_with(10, 0, 0)
+    States.on_received_report(segment_control, {SynOption.RECEIVED: (8).to_bytes(4, 'big')})
+    # An older ACK, overtaken by the one above
+    States.on_received_report(segment_control, {SynOption.RECEIVED: (5).to_bytes(4, 'big')})
+    States.on_received_report(segment_control, {})
+    assert segment_control.num_received == 8
@@ -0,0 +1,172 @@
+import os
+from src.enums import InsertStatus
+from src.helpers.fec import Fec, FecEncoder
+from src.helpers.stp_helpers import Stp
+from src.receiver.reassembly import ReassemblyWindow, MAX_SEQNO
+
+MSS = 100
+MAX_WIN = 400
+
+def segments(first_seqno, count, last_length=MSS):
+    '''
+        count consecutive segments of random data from first_seqno, the last one last_length bytes long.
+    '''
+    result = []
+    for i in range(count):
+        length = last_length if i == count - 1 else MSS
+        result.append(((first_seqno + i * MSS) % MAX_SEQNO, os.urandom(length)))
+    return result
+
+def parity_of(group):
+    '''
+        Returns the arguments of insert_parity() for a group, as the sender encodes them.
+    '''
+    encoder = FecEncoder(len(group))
+    for i, (seqno, data) in enumerate(group):
+        encoded = encoder.add(seqno, data, is_last=i == len(group) - 1)
+    first_seqno, segment = encoded
+    _, seqno, payload = Stp.extract_stp_segment(segment)
+    assert seqno == first_seqno
+    return (first_seqno, *Fec.extract_parity(payload))
+
+def test_in_order():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    group = segments(0, 3, last_length=10)
+    for seqno, data in group:
+        assert buff.insert(seqno, data) == InsertStatus.IN_ORDER
+        assert buff.deliver() == data
+    assert buff.expct_seqno == 210
+    assert buff.deliver() == b''
+
+def test_out_of_order():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    group = segments(0, 4)
+    for seqno, data in reversed(group[1:]):
+        assert buff.insert(seqno, data) == InsertStatus.BUFFERED
+    assert buff.deliver() == b''
+    assert buff.insert(*group[0]) == InsertStatus.IN_ORDER
+    assert buff.deliver() == b''.join(data for _, data in group)
+    assert buff.expct_seqno == 400
+
+def test_wraparound():
+    expct_seqno = MAX_SEQNO - 150
+    buff = ReassemblyWindow(MAX_WIN, MSS, expct_seqno)
+    group = segments(expct_seqno, 4, last_length=30)
+    assert [seqno for seqno, _ in group] == [MAX_SEQNO - 150, MAX_SEQNO - 50, 50, 150]
+    for seqno, data in reversed(group[1:]):
+        assert buff.insert(seqno, data) == InsertStatus.BUFFERED
+    assert buff.insert(*group[0]) == InsertStatus.IN_ORDER
+    assert buff.deliver() == b''.join(data for _, data in group)
+    assert buff.expct_seqno == 180
+
+def test_stops_after_short_segment():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    buff.insert(0, b'x' * 10)
+    # Nothing can follow the last segment of a stream, even if a stale one sits in the next slot
+    buff.bitmap[1] = 1
+    assert buff.deliver() == b'x' * 10
+    assert buff.expct_seqno == 10
+
+def test_duplicate():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    group = segments(0, 3)
+    # Buffered twice
+    assert buff.insert(*group[1]) == InsertStatus.BUFFERED
+    assert buff.insert(*group[1]) == InsertStatus.DUPLICATE
+    # Already delivered
+    buff.insert(*group[0])
+    buff.deliver()
+    assert buff.insert(*group[0]) == InsertStatus.DUPLICATE
+    assert buff.insert(*group[1]) == InsertStatus.DUPLICATE
+    # Delivered long ago, before the seqno wrapped around
+    assert buff.insert((200 - 10 * MSS) % MAX_SEQNO, group[0][1]) == InsertStatus.DUPLICATE
+    assert buff.insert(*group[2]) == InsertStatus.IN_ORDER
+
+def test_out_of_window():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    assert buff.advertised_window() == MAX_WIN
+    # Past the window
+    assert buff.insert(MAX_WIN, b'x' * MSS) == InsertStatus.OUT_OF_WINDOW
+    assert buff.insert(MAX_SEQNO // 2 - MSS, b'x' * MSS) == InsertStatus.OUT_OF_WINDOW
+    # Not on a segment boundary
+    assert buff.insert(50, b'x' * MSS) == InsertStatus.OUT_OF_WINDOW
+    # Larger than the MSS
+    assert buff.insert(0, b'x' * (MSS + 1)) == InsertStatus.OUT_OF_WINDOW
+    assert buff.insert(MAX_WIN - MSS, b'x' * MSS) == InsertStatus.BUFFERED
+
+def test_backlog_shrinks_window():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0)
+    buff.backlog = 250
+    assert buff.advertised_window() == 100
+    assert buff.insert(MSS, b'x' * MSS) == InsertStatus.OUT_OF_WINDOW
+    assert buff.insert(0, b'x' * MSS) == InsertStatus.IN_ORDER
+    buff.backlog = MAX_WIN + 10
+    assert buff.advertised_window() == 0
+
+def test_parity_in_window():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0, history=4)
+    group = segments(0, 4)
+    for i in (0, 1, 3):
+        buff.insert(*group[i])
+    assert buff.deliver() == group[0][1] + group[1][1]
+    assert buff.insert_parity(*parity_of(group))
+    assert buff.deliver() == group[2][1] + group[3][1]
+    assert buff.total_recovered == 1
+
+def test_parity_from_history():
+    # The group starts just before the wraparound and its first segments are already delivered
+    first_seqno = MAX_SEQNO - 2 * MSS
+    buff = ReassemblyWindow(MAX_WIN, MSS, first_seqno, history=4)
+    group = segments(first_seqno, 4, last_length=42)
+    buff.insert(*group[0])
+    buff.insert(*group[1])
+    buff.deliver()
+    buff.insert(*group[2])
+    buff.deliver()
+    assert buff.expct_seqno == MSS
+    assert buff.insert_parity(*parity_of(group))
+    # The rebuilt segment is the short one, the length XOR gives its length back
+    assert buff.deliver() == group[3][1]
+    assert buff.expct_seqno == MSS + 42
+
+def test_parity_past_history():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0, history=1)
+    group = segments(0, 4)
+    for i in (0, 1, 3):
+        buff.insert(*group[i])
+    buff.deliver()
+    # The first segment of the group is no longer readable
+    assert not buff.insert_parity(*parity_of(group))
+    assert not buff.pending_parity
+
+def test_parity_not_needed():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0, history=4)
+    group = segments(0, 4)
+    for seqno, data in group:
+        buff.insert(seqno, data)
+    assert not buff.insert_parity(*parity_of(group))
+    assert not buff.pending_parity
+    assert buff.deliver() == b''.join(data for _, data in group)
+    assert buff.total_recovered == 0
+
+def test_pending_parity():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0, history=4)
+    group = segments(0, 4)
+    buff.insert(*group[0])
+    buff.insert(*group[3])
+    # Two segments are missing, the parity waits for one of them
+    assert not buff.insert_parity(*parity_of(group))
+    assert list(buff.pending_parity) == [0]
+    assert sorted(buff.parity_groups) == [0, 100, 200, 300]
+    assert buff.insert(*group[2]) == InsertStatus.BUFFERED
+    assert buff.total_recovered == 1
+    assert not buff.pending_parity and not buff.parity_groups
+    assert buff.deliver() == b''.join(data for _, data in group)
+
+def test_parity_out_of_window():
+    buff = ReassemblyWindow(MAX_WIN, MSS, 0, history=4)
+    group = segments(2 * MSS, 4)
+    buff.insert(*group[0])
+    # The last segment of the group is past the window, it could never be placed
+    assert not buff.insert_parity(*parity_of(group))
+    assert not buff.pending_parity and not buff.parity_groups
@@ -0,0 +1,137 @@
+from src.sender.scoreboard import Scoreboard, MAX_SEQNO
+
+MSS = 100
+MAX_WIN = 400
+
+def send_new(board, count, last_length=MSS, now=0.0):
+    for i in range(count):
+        board.on_send(board.next_seqno, last_length if i == count - 1 else MSS, now)
+
+def test_send():
+    board = Scoreboard(MAX_WIN, MSS, 1000)
+    send_new(board, 3, last_length=30)
+    assert board.count == 3
+    assert board.inflight_bytes == 230
+    assert board.next_seqno == 1230
+    assert board.base_seqno == 1000
+    assert board.total_sent == 3
+    assert board.total_retrans == 0
+
+def test_can_send():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    assert board.can_send(MSS, MAX_WIN)
+    send_new(board, 3)
+    # Limited by the window
+    assert not board.can_send(MSS, 250)
+    assert board.can_send(MSS, 400)
+    send_new(board, 1)
+    # Limited by the scoreboard
+    assert not board.can_send(MSS, 10 * MAX_WIN)
+
+def test_lookup():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 3)
+    assert [board.lookup(seqno) for seqno in (0, 100, 200)] == [0, 1, 2]
+    assert board.lookup(300) == -1
+    assert board.lookup(MAX_SEQNO - MSS) == -1
+    board.on_ack(100, 0.0)
+    assert board.lookup(0) == -1
+    assert board.lookup(200) == 1
+
+def test_ack():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 4)
+    assert board.on_ack(200, 0.0) == 2
+    assert board.base_seqno == 200
+    assert board.inflight_bytes == 200
+    assert board.count == 2
+    # The freed slots are used again
+    assert board.can_send(MSS, MAX_WIN)
+    send_new(board, 2)
+    assert board.on_ack(600, 0.0) == 4
+    assert board.count == 0 and board.inflight_bytes == 0
+
+def test_partial_ack():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 2)
+    # Part of the first segment only, nothing is freed
+    assert board.on_ack(50, 0.0) == 0
+    assert board.count == 2
+    assert board.base_seqno == 0
+    assert board.on_ack(150, 0.0) == 1
+    assert board.base_seqno == 100
+
+def test_duplicate_and_old_ack():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 3)
+    assert board.on_ack(100, 0.0) == 1
+    # The same ACK again
+    assert board.on_ack(100, 0.0) == 0
+    # An ACK from before
+    assert board.on_ack(0, 0.0) == 0
+    # An ACK for data never sent
+    assert board.on_ack(500, 0.0) == 0
+    assert board.count == 2 and board.base_seqno == 100
+
+def test_wraparound():
+    isn = MAX_SEQNO - 150
+    board = Scoreboard(MAX_WIN, MSS, isn)
+    send_new(board, 4, last_length=20)
+    assert board.next_seqno == 170
+    assert board.lookup(50) == 2
+    assert board.on_ack(MAX_SEQNO - 50, 0.0) == 1
+    assert board.on_ack(150, 0.0) == 2
+    assert board.base_seqno == 150
+    assert board.on_ack(170, 0.0) == 1
+    assert board.count == 0
+
+def test_retransmissions():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 3)
+    board.on_send(100, MSS, 0.0, is_loss=True)
+    board.on_send(0, MSS, 0.0, is_loss=True)
+    # A zero window probe, not a loss
+    board.on_send(200, MSS, 0.0)
+    assert board.total_sent == 3
+    assert board.total_retrans == 3
+    assert board.total_lost == 2
+    # Retransmissions take no slot
+    assert board.count == 3 and board.inflight_bytes == 300
+    board.on_ack(300, 0.0)
+    # Nothing in flight is left to retransmit
+    board.on_send(0, MSS, 0.0, is_loss=True)
+    assert board.total_retrans == 3
+    assert board.total_lost == 2
+
+def test_rtt_sample():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    assert board.last_rtt is None
+    send_new(board, 1, now=10.0)
+    send_new(board, 1, now=15.0)
+    # From the newest segment the ACK covers
+    board.on_ack(200, 60.0)
+    assert board.last_rtt == 45.0
+
+def test_no_rtt_sample_from_retransmission():
+    board = Scoreboard(MAX_WIN, MSS, 0)
+    send_new(board, 2, now=10.0)
+    board.on_ack(100, 30.0)
+    assert board.last_rtt == 20.0
+    # Karn's algorithm: the ACK of a retransmitted segment could be for either copy
+    board.on_send(100, MSS, 100.0, is_loss=True)
+    board.on_send(100, MSS, 200.0, is_loss=True)
+    board.on_ack(200, 250.0)
+    assert board.last_rtt == 20.0
+    assert board.total_retrans == 2
+    assert board.total_retrans_segments == 1
+
+def test_slot_reused_after_retransmission():
+    board = Scoreboard(MSS, MSS, 0)
+    send_new(board, 1, now=0.0)
+    board.on_send(0, MSS, 50.0, is_loss=True)
+    board.on_ack(100, 80.0)
+    # A new segment in the same slot starts with no retransmission
+    send_new(board, 1, now=100.0)
+    board.on_ack(200, 130.0)
+    assert board.last_rtt == 30.0
+    assert board.total_retrans_segments == 1
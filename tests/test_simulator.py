@@ -0,0 +1,84 @@
+import os
+import random
+import pytest
+from src.helpers.fec import MAX_FEC_GROUP
+from src.helpers.helpers import Helpers
+from src.simulator.simulator import simulate_transfer
+
+TESTS_DIR = os.path.dirname(__file__)
+FILE = os.path.join(TESTS_DIR, 'random3.txt')
+REPLY_FILE = os.path.join(TESTS_DIR, 'random1.txt')
+
+# The state machines would log every segment
+Helpers.is_logging = False
+
+@pytest.fixture
+def basis_file(tmp_path):
+    '''
+        An earlier copy of FILE, with a few bytes changed, some removed and some added.
+    '''
+    with open(FILE, 'rb') as f:
+        data = bytearray(f.read())
+    data[1000:1010] = b'x' * 10
+    del data[20000:20500]
+    data[30000:30000] = b'inserted' * 50
+    path = tmp_path / 'basis.txt'
+    path.write_bytes(bytes(data))
+    return str(path)
+
+@pytest.mark.parametrize('loss', [0.0, 0.1, 0.3])
+@pytest.mark.parametrize('options', [
+    {},
+    {'fec': (4, False)},
+    {'fec': (MAX_FEC_GROUP, True)},
+    {'reply_file': REPLY_FILE},
+    {'is_fast_open': True},
+    {'is_fast_open': True, 'reply_file': REPLY_FILE},
+], ids=['plain', 'fec', 'fec-auto', 'reply', 'fast-open', 'fast-open-reply'])
+def test_transfer(options, loss):
+    for seed in range(5):
+        result = simulate_transfer(FILE, 5000, 0.1, loss, 10, jitter=5, seed=seed, **options)
+        assert result.is_complete and result.is_identical, f'seed {seed}'
+
+@pytest.mark.parametrize('loss', [0.0, 0.1, 0.3])
+def test_delta(basis_file, loss):
+    for seed in range(5):
+        result = simulate_transfer(FILE, 5000, 0.1, loss, 10, jitter=5, seed=seed, basis_file=basis_file)
+        assert result.is_complete and result.is_identical, f'seed {seed}'
+
+def test_delta_sends_less(basis_file):
+    full = simulate_transfer(FILE, 5000, 0.1, 0.0, 10)
+    delta = simulate_transfer(FILE, 5000, 0.1, 0.0, 10, basis_file=basis_file)
+    assert delta.is_identical
+    assert delta.num_sent < full.num_sent // 4
+
+def test_small_receiver_window():
+    # The sender has to respect the window the receiver advertises
+    for seed in range(5):
+        result = simulate_transfer(FILE, 20000, 0.1, 0.1, 10, jitter=5, seed=seed, rcvr_max_win=3000)
+        assert result.is_complete and result.is_identical, f'seed {seed}'
+
+def test_fec_recovers():
+    result = simulate_transfer(FILE, 5000, 0.1, 0.1, 10, seed=1, fec=(4, False))
+    assert result.is_identical and result.num_recovered > 0
+
+def test_global_random_untouched():
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    simulate_transfer(FILE, 5000, 0.1, 0.2, 10, jitter=5, seed=3, reply_file=REPLY_FILE)
+    assert random.random() == expected
+
+def test_deterministic():
+    first = simulate_transfer(FILE, 5000, 0.1, 0.2, 10, jitter=5, seed=3, reply_file=REPLY_FILE)
+    random.seed(7)
+    second = simulate_transfer(FILE, 5000, 0.1, 0.2, 10, jitter=5, seed=3, reply_file=REPLY_FILE)
+    assert first == second
+
+@pytest.mark.parametrize('size', [0, 1, 999, 1000, 1001])
+def test_small_files(tmp_path, size):
+    path = tmp_path / 'small.txt'
+    path.write_bytes(os.urandom(size))
+    for seed in range(3):
+        result = simulate_transfer(str(path), 5000, 0.1, 0.2, 10, jitter=5, seed=seed, reply_file=str(path))
+        assert result.is_complete and result.is_identical, f'seed {seed}'